@@ -0,0 +1,176 @@
+import os
+import csv
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+import preprocess
+import deadline
+import frame_source
+from rate_limit import RateLimiter
+from bench_latency import summarise, print_table
+
+### This is batch_narrate.py ###
+# Headless batch narration for evaluating prompts and measuring throughput. Frames are sampled from a
+# directory of images or a video file, go through the same preprocessing as a live capture, are sent
+# to the vision model and (with --tts) turned into audio that isn't played. Each item's narration and
+# timings are written to a CSV or JSONL file as soon as it finishes.
+#   python batch_narrate.py clips/street.mp4 --every 30 --workers 4 --rate 2 -o street.jsonl
+# Requests run on a thread pool (--processes for a process pool, when preprocessing is the bottleneck)
+# and a token bucket per provider keeps them under the provider's rate limit.
+
+logger = logging.getLogger()
+
+FIELDS = ("index", "source", "style", "roi_mode", "upload_bytes", "preprocess", "analyze",
+          "tts_first_chunk", "tts_bytes", "total", "narration", "error")
+
+# Per worker state, set by init_worker (once per process, or once for all threads)
+_router = None
+_prompts = None
+_limiter = None
+
+
+def init_worker(rate, burst):
+    global _router, _prompts, _limiter
+    from replay_session import make_router
+    _router, _prompts = make_router()
+    _limiter = RateLimiter(rate, burst) if rate else None
+
+
+# FUNC: Sample frames from a directory, image or video file, yields (index, source name, frame)
+def sample_frames(spec, every=1, limit=None):
+    source = frame_source.open_frame_source(spec, loop=False)
+    if not source.isOpened():
+        raise ValueError(f"Can't open {spec}")
+    count, position = 0, 0
+    try:
+        while limit is None or count < limit:
+            ret, frame = source.read()
+            if not ret:
+                break
+            position += 1
+            if (position - 1) % every:
+                continue
+            name = os.path.basename(source.paths[position - 1]) if isinstance(source, frame_source.ImageSource) else f"frame {position - 1}"
+            yield count, name, frame
+            count += 1
+    finally:
+        source.release()
+
+
+# FUNC: Narrate one frame, returns a result row (never raises, errors go in the row)
+def narrate_item(index, name, frame, style="Guide", roi_mode=preprocess.ROI_CONTEXT, tts=False, timeout=15.0):
+    row = {"index": index, "source": name, "style": style, "roi_mode": roi_mode}
+    start = time.time()
+    try:
+        images = preprocess.prepare_upload(frame, roi_mode)
+        row["upload_bytes"] = sum(len(b64) for _, b64 in images)
+        row["preprocess"] = time.time() - start
+
+        if _limiter:
+            _limiter.acquire("vision")
+        stage_start = time.time()
+        row["narration"] = deadline.retry_call(
+            lambda remaining: _router.describe(_prompts[style], [], [b64 for _, b64 in images], timeout=remaining),
+            deadline.Deadline(timeout),
+            stage="batch_analyze",
+        )
+        row["analyze"] = time.time() - stage_start
+
+        if tts:
+            from replay_session import replay_tts
+            if _limiter:
+                _limiter.acquire("tts")
+            row["tts_first_chunk"], row["tts_bytes"] = replay_tts(row["narration"])
+    except Exception as e:
+        logger.error(f"Item {index} ({name}) failed: {e}")
+        row["error"] = str(e)
+    row["total"] = time.time() - start
+    return row
+
+
+class ResultWriter:
+    """Writes result rows to a .csv or .jsonl file (by extension) as they arrive."""
+
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.csv = None
+        if path.lower().endswith(".csv"):
+            self.csv = csv.DictWriter(self.file, fieldnames=FIELDS)
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.csv:
+            self.csv.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def run(args):
+    writer = ResultWriter(args.output)
+    samples = {}
+    options = {"style": args.style, "roi_mode": args.roi, "tts": args.tts, "timeout": args.timeout}
+    if args.processes:
+        # Each process has its own client and token bucket, so they share the rate and burst between them
+        # (a bucket needs room for at least one request)
+        pool = ProcessPoolExecutor(args.workers, initializer=init_worker,
+                                   initargs=(args.rate / args.workers if args.rate else None, max(1.0, args.burst / args.workers)))
+    else:
+        init_worker(args.rate, args.burst)
+        pool = ThreadPoolExecutor(args.workers, thread_name_prefix="batch")
+
+    def collect(done):
+        for future in done:
+            row = future.result()
+            writer.write(row)
+            for stage in ("preprocess", "analyze", "tts_first_chunk", "total"):
+                if row.get(stage) is not None:
+                    samples.setdefault(stage, []).append(row[stage])
+            errors.append(bool(row.get("error")))
+
+    errors = []
+    pending = set()
+    start = time.time()
+    try:
+        for index, name, frame in sample_frames(args.input, args.every, args.limit):
+            # Only keep a few frames queued, decoded video frames are big
+            if len(pending) >= 2 * args.workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(narrate_item, index, name, frame, **options))
+        done, _ = wait(pending)
+        collect(done)
+    finally:
+        pool.shutdown(cancel_futures=True)
+        writer.close()
+
+    elapsed = time.time() - start
+    print_table(summarise(samples))
+    print(f"{len(errors)} items in {elapsed:.1f} seconds ({len(errors) / max(elapsed, 1e-9):.2f} per second), "
+          f"{sum(errors)} errors, results in {args.output}")
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Narrate a directory of images or a video file offline")
+    parser.add_argument("input", help="Directory of images, an image or a video file")
+    parser.add_argument("-o", "--output", type=str, default="narrations.jsonl", help="Results file, .csv or .jsonl")
+    parser.add_argument("-e", "--every", type=int, default=1, help="Use every Nth frame (for video)")
+    parser.add_argument("-l", "--limit", type=int, help="Stop after this many frames")
+    parser.add_argument("-s", "--style", type=str, default="Guide", help="Prompt from prompts.txt")
+    parser.add_argument("--roi", choices=preprocess.ROI_MODES, default=preprocess.ROI_CONTEXT)
+    parser.add_argument("--tts", action="store_true", help="Also generate the audio (not played)")
+    parser.add_argument("-w", "--workers", type=int, default=4)
+    parser.add_argument("--processes", action="store_true", help="Use a process pool instead of threads")
+    parser.add_argument("--rate", type=float, default=1.0, help="Max requests per second to each provider, 0 for no limit")
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=15.0, help="Seconds per item for the vision request incl. retries")
+    parser.add_argument("-d", "--debug", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    run(args)
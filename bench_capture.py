@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import argparse
+import threading
+import preprocess
+import frame_source
+from preprocess_worker import InlinePreprocessor, PreprocessWorker
+from bench_latency import summarise, print_table, REPO_DIR
+
+### This is bench_capture.py ###
+# Capture latency and audio stutter with the preprocessing inline vs in the preprocess worker process.
+# Audio underruns are approximated by a probe thread that behaves like an audio callback: it has to wake
+# every --period ms and do a little Python work, and a wake-up more than --buffer ms late is counted as
+# an underrun (the sound card would have run out of samples). Captures run back to back meanwhile.
+#   python bench_capture.py -n 100 -f clips/street.mp4
+
+
+class JitterProbe(threading.Thread):
+    """Wakes every period seconds and records how late each wake-up was."""
+
+    def __init__(self, period=0.01, buffer=0.02):
+        super().__init__(daemon=True)
+        self.period = period
+        self.buffer = buffer
+        self.lateness = []
+        self.stop_event = threading.Event()
+
+    def run(self):
+        due = time.perf_counter() + self.period
+        while not self.stop_event.is_set():
+            time.sleep(max(0.0, due - time.perf_counter()))
+            now = time.perf_counter()
+            self.lateness.append(max(0.0, now - due))
+            # A little interpreter work, like copying a chunk of audio
+            sum(range(200))
+            due = max(due + self.period, now)
+
+    @property
+    def underruns(self):
+        return sum(1 for late in self.lateness if late > self.buffer)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def run_mode(mode, args):
+    # The worker forks, so it has to exist before the probe thread is started
+    preprocessor = PreprocessWorker() if mode == "worker" else InlinePreprocessor()
+    source = frame_source.open_frame_source(args.frames)
+    samples = {}
+    probe = JitterProbe(args.period / 1000.0, args.buffer / 1000.0)
+    try:
+        for i in range(args.warmup + args.iterations):
+            if i == args.warmup:
+                probe.start()
+            start = time.perf_counter()
+            ret, frame = source.read()
+            if not ret:
+                raise ValueError(f"Can't read a frame from {args.frames}")
+            preprocessor.process(frame, args.roi)
+            if i >= args.warmup:
+                samples.setdefault(f"{mode}_capture", []).append(time.perf_counter() - start)
+    finally:
+        if probe.is_alive():
+            probe.stop()
+        preprocessor.close()
+        source.release()
+    samples[f"{mode}_probe_lateness"] = probe.lateness
+    return samples, probe.underruns, len(probe.lateness)
+
+
+def run(args):
+    rows, underruns = [], {}
+    modes = ("inline", "worker") if args.mode == "both" else (args.mode,)
+    for mode in modes:
+        samples, count, wakeups = run_mode(mode, args)
+        rows += summarise(samples)
+        underruns[mode] = {"underruns": count, "wakeups": wakeups}
+    print_table(rows)
+    for mode, result in underruns.items():
+        print(f"{mode}: {result['underruns']} underruns in {result['wakeups']} wake-ups "
+              f"(period {args.period:.0f} ms, buffer {args.buffer:.0f} ms)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "stages": rows, "underruns": underruns}, f, indent=2)
+    return rows, underruns
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture latency and audio underruns, inline vs preprocess worker")
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    parser.add_argument("-w", "--warmup", type=int, default=3)
+    parser.add_argument("-f", "--frames", type=str, default=os.path.join(REPO_DIR, "image.jpeg"), help="Video file, image or directory of images")
+    parser.add_argument("-m", "--mode", choices=("inline", "worker", "both"), default="both")
+    parser.add_argument("--roi", choices=preprocess.ROI_MODES, default=preprocess.ROI_CONTEXT)
+    parser.add_argument("--period", type=float, default=10.0, help="Probe wake-up period (ms)")
+    parser.add_argument("--buffer", type=float, default=20.0, help="Lateness counted as an underrun (ms)")
+    parser.add_argument("--json", type=str, help="Write the results to this file")
+    run(parser.parse_args())
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import asyncio
+import argparse
+import subprocess
+import httpx
+import cv2
+import numpy as np
+import prompt_registry
+from bench_latency import REPO_DIR, summarise, print_table
+from vision_backends import visguide_api_headers
+from visguide_gateway import Gateway
+
+### This is bench_gateway.py ###
+# End to end check of visguide_gateway.py without an OpenAI key. It starts the gateway with --mock-upstream
+# on a free port and plays several devices against it:
+#   - burst:    every device sends the same frame at once, one request goes upstream and the rest share it
+#   - repeat:   every device sends it again, all answered from the cache
+#   - script:   one device sends it after a conversation, a different key so it goes upstream again
+#   - flood:    one device keeps sending new conversations until its token bucket runs dry (429)
+#   - shared:   two devices with the same API key, one runs its bucket dry and the other is still answered
+#   - similar:  a re-encoded copy of the frame, answered from the cache for the Tourist prompt but sent
+#               upstream for the Guide style CONTEXT, whose hazard narrations are only reused for the same image
+# It reports p50/p95/p99 for each phase and the gateway's /stats, and exits 1 if the counts are off, e.g.
+#   python bench_gateway.py --devices 8 --llm-latency 1.0
+
+CONTEXT = "You are a guide for a blind person, describe the scene ahead briefly."
+
+
+# FUNC: A port nothing is listening on
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# FUNC: Start the gateway in its own process and wait until it answers /health
+def start_gateway(port, llm_latency, timeout=15.0):
+    # A bucket of 3 that barely refills, so the flood runs it dry however slow the mock upstream is
+    env = dict(os.environ, VISGUIDE_GATEWAY_RATE="0.001", VISGUIDE_GATEWAY_BURST="3")
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, "visguide_gateway.py"), "--mock-upstream",
+                                "--host", "127.0.0.1", "--port", str(port), "--llm-latency", str(llm_latency)], env=env)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Gateway exited with {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1.0).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Gateway did not come up on port {port} within {timeout:.0f} seconds")
+
+
+async def ask(client, samples, phase, device, image, script=(), api_key=None, context=CONTEXT):
+    request = {"context": context, "parameters": {"max_tokens": 300}, "script": list(script), "image": image}
+    start = time.time()
+    # The same headers the devices send
+    response = await client.post("/analyze", json=request, headers=visguide_api_headers(api_key, device))
+    samples.setdefault(phase, []).append(time.time() - start)
+    return response.status_code
+
+
+# FUNC: The same frame encoded again at a lower quality, different bytes but the same scene
+def reencode(image, quality=70):
+    frame = cv2.imdecode(np.frombuffer(base64.b64decode(image), np.uint8), cv2.IMREAD_COLOR)
+    return base64.b64encode(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1]).decode()
+
+
+async def exercise(url, image, devices):
+    samples, statuses = {}, {}
+    async with httpx.AsyncClient(base_url=url, timeout=30.0) as client:
+        names = [f"device-{i}" for i in range(devices)]
+        statuses["burst"] = await asyncio.gather(*(ask(client, samples, "burst", name, image) for name in names))
+        statuses["repeat"] = await asyncio.gather(*(ask(client, samples, "repeat", name, image) for name in names))
+        script = [{"role": "assistant", "content": "There is a closed door ahead."}]
+        statuses["script"] = [await ask(client, samples, "script", names[0], image, script)]
+        # device-0 has spent one token on the burst and one on the script, the bucket holds 3
+        flood = []
+        for i in range(3):
+            script = script + [{"role": "assistant", "content": f"Still the door, {i}."}]
+            flood.append(await ask(client, samples, "flood", names[0], image, script))
+        statuses["flood"] = flood
+        shared = []
+        for device in ("pi-a", "pi-a", "pi-a", "pi-a", "pi-b"):
+            script = script + [{"role": "assistant", "content": f"{device} again."}]
+            shared.append(await ask(client, samples, "shared", device, image, script, api_key="shared-key"))
+        statuses["shared"] = shared
+        tourist = str(prompt_registry.load_prompts(os.path.join(REPO_DIR, "prompts.txt"))["Tourist"])
+        similar = reencode(image)
+        statuses["similar"] = [
+            await ask(client, samples, "similar", "tourist-0", image, context=tourist),
+            await ask(client, samples, "similar", "tourist-1", similar, context=tourist),
+            await ask(client, samples, "similar", "guide-0", similar),
+        ]
+        stats = (await client.get("/stats")).json()
+    return samples, statuses, stats
+
+
+# FUNC: What the phases should have done, one line per problem
+def check(statuses, stats, devices):
+    problems = []
+    for phase in ("burst", "repeat", "script"):
+        if any(status != 200 for status in statuses[phase]):
+            problems.append(f"{phase}: statuses {statuses[phase]}")
+    if statuses["flood"] != [200, 429, 429]:
+        problems.append(f"flood: statuses {statuses['flood']}, expected [200, 429, 429]")
+    if statuses["similar"] != [200, 200, 200]:
+        problems.append(f"similar: statuses {statuses['similar']}")
+    if statuses["shared"] != [200, 200, 200, 429, 200]:
+        problems.append(f"shared: statuses {statuses['shared']}, expected [200, 200, 200, 429, 200]")
+    # Without X-Device-Id devices behind one key are still told apart by address
+    same_key = {"authorization": "Bearer shared-key"}
+    if Gateway.device_id(same_key, "10.0.0.2") == Gateway.device_id(same_key, "10.0.0.3"):
+        problems.append("devices sharing an API key share a rate limit bucket")
+    # The similar phase adds two upstream requests (the first Tourist one and the Guide one) and one cache hit
+    expected = {"upstream": 9, "coalesced": devices - 1, "cache_hits": devices + 1, "rate_limited": 3, "errors": 0}
+    for name, value in expected.items():
+        if stats.get(name) != value:
+            problems.append(f"stats {name} is {stats.get(name)}, expected {value}")
+    return problems
+
+
+def run(args):
+    with open(args.image, "rb") as f:
+        image = base64.b64encode(f.read()).decode()
+    port = free_port()
+    gateway = start_gateway(port, args.llm_latency)
+    try:
+        samples, statuses, stats = asyncio.run(exercise(f"http://127.0.0.1:{port}", image, args.devices))
+    finally:
+        gateway.terminate()
+        gateway.wait()
+    rows = summarise(samples)
+    print_table(rows)
+    print("gateway stats: " + ", ".join(f"{name} {value}" for name, value in stats.items()))
+    problems = check(statuses, stats, args.devices)
+    for problem in problems:
+        print(f"FAIL {problem}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "phases": rows, "stats": stats, "problems": problems}, f, indent=2)
+    return not problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check visguide_gateway.py against its mock upstream")
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("-i", "--image", type=str, default=os.path.join(REPO_DIR, "image.jpeg"))
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Seconds before the mock upstream answers")
+    parser.add_argument("--json", type=str, help="Write the results to this file")
+    sys.exit(0 if run(parser.parse_args()) else 1)
@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import time
+import types
+import random
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+### This is bench_latency.py ###
+# End to end latency benchmark for visguide.py without camera, network or speaker.
+#   - frames come from a video file, an image or a directory of images (default image.jpeg)
+#   - a local stand-in server answers the OpenAI and ElevenLabs calls with configurable latency
+#   - audio goes to a null sink that notes when the first chunk would have been played
+# It drives the real button handlers and single_loop and reports p50/p95/p99 for each stage and
+# for button press to first audio, e.g.
+#   python bench_latency.py -n 50 --llm-latency 1.5 --tts-latency 0.3 --json results.json
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_NARRATION = "There is a closed door about three paces ahead. The corridor is clear and quiet."
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    """Answers POST /v1/chat/completions and POST /v1/text-to-speech/<voice>/stream."""
+    protocol_version = "HTTP/1.1"
+
+    def _delay(self, latency):
+        jitter = self.server.settings["jitter"]
+        time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.request_bytes.append(len(body))
+        settings = self.server.settings
+        if self.path.endswith("/chat/completions"):
+            self._delay(settings["llm_latency"])
+            payload = json.dumps({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "gpt-4-vision-preview",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": FAKE_NARRATION}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        elif "/text-to-speech/" in self.path:
+            self._delay(settings["tts_latency"])
+            chunk = b"\xff\xf3" + bytes(settings["tts_chunk_size"] - 2)
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.send_header("Content-Length", str(len(chunk) * settings["tts_chunks"]))
+            self.end_headers()
+            for _ in range(settings["tts_chunks"]):
+                self.wfile.write(chunk)
+                self.wfile.flush()
+                time.sleep(settings["tts_chunk_interval"])
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeProviderServer:
+    """Local stand-in for the OpenAI and ElevenLabs APIs, on a free port in a background thread."""
+
+    def __init__(self, llm_latency=1.0, tts_latency=0.3, jitter=0.0, tts_chunks=8, tts_chunk_size=4096, tts_chunk_interval=0.05):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeProviderHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.request_bytes = []
+        self.httpd.settings = {
+            "llm_latency": llm_latency,
+            "tts_latency": tts_latency,
+            "jitter": jitter,
+            "tts_chunks": tts_chunks,
+            "tts_chunk_size": tts_chunk_size,
+            "tts_chunk_interval": tts_chunk_interval,
+        }
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    @property
+    def request_bytes(self):
+        return self.httpd.request_bytes
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# Null replacement for the simpleaudio module, so the wav prompts and clicks cost nothing
+def null_simpleaudio():
+    class PlayObject:
+        def wait_done(self):
+            pass
+
+        def is_playing(self):
+            return False
+
+        def stop(self):
+            pass
+
+    class WaveObject:
+        @staticmethod
+        def from_wave_file(path):
+            return WaveObject()
+
+        def play(self):
+            return PlayObject()
+
+    module = types.ModuleType("simpleaudio")
+    module.WaveObject = WaveObject
+    module.play_buffer = lambda *args, **kwargs: PlayObject()
+    return module
+
+
+class NullAudioSink:
+    """Stands in for elevenlabs.stream: consumes the audio and notes when the first chunk arrived."""
+
+    def __init__(self):
+        self.first_chunk_time = None
+        self.bytes = 0
+
+    def reset(self):
+        self.first_chunk_time = None
+        self.bytes = 0
+
+    def __call__(self, audio_stream):
+        for chunk in audio_stream:
+            if self.first_chunk_time is None:
+                self.first_chunk_time = time.time()
+            self.bytes += len(chunk)
+        return b""
+
+
+# FUNC: Nearest rank percentile
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+# FUNC: Wrap a visguide function so every call's duration is added to samples[name]
+def timed(samples, name, fn):
+    def wrapper(*args, **kwargs):
+        start = time.time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            samples.setdefault(name, []).append(time.time() - start)
+    return wrapper
+
+
+def summarise(samples):
+    rows = []
+    for name, values in samples.items():
+        rows.append({
+            "stage": name,
+            "n": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values) if values else 0.0,
+        })
+    return rows
+
+
+def print_table(rows):
+    print(f"{'stage':<22}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for row in rows:
+        print(f"{row['stage']:<22}{row['n']:>5}{row['p50'] * 1000:>10.1f}{row['p95'] * 1000:>10.1f}"
+              f"{row['p99'] * 1000:>10.1f}{row['max'] * 1000:>10.1f}")
+
+
+# FUNC: Import visguide.py pointed at the fake server, the synthetic frames and the null audio
+def load_visguide(server_url, frames, env_path, record=None, scene_cache=False):
+    os.environ.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": server_url,
+        "ELEVENLABS_API_KEY": "bench",
+        "ELEVEN_BASE_URL": server_url,
+        "ELEVENLABS_VOICE_ID": "bench-guide",
+        "TOURIST_VOICE_ID": "bench-tourist",
+        "VISMODE": "Single",
+        "VISSTYLE": "Guide",
+        # The same frames come round again and again, only reuse narrations when that's what is being measured
+        "VISGUIDE_SCENE_CACHE_TTL": "5" if scene_cache else "0",
+    })
+    os.environ.pop("VISGUIDE_API_URL", None)
+    sys.modules["simpleaudio"] = null_simpleaudio()
+    os.chdir(REPO_DIR)
+    sys.argv = ["visguide.py", "--camera", frames] + (["--record", record] if record else [])
+    sys.path.insert(0, REPO_DIR)
+    import visguide
+    # Keep the triple press from rewriting the real .env
+    visguide.config.path = env_path
+    return visguide
+
+
+def run(args):
+    server = FakeProviderServer(args.llm_latency, args.tts_latency, args.jitter, args.tts_chunks).start()
+    env_path = os.path.join(tempfile.mkdtemp(prefix="visguide-bench-"), ".env")
+    visguide = load_visguide(server.url, args.frames, env_path, args.record, args.scene_cache)
+    sink = NullAudioSink()
+    samples = {}
+
+    visguide.stream = sink
+    visguide.audio_player = None
+    visguide.capture_image = timed(samples, "capture_image", visguide.capture_image)
+    visguide.analyze_image = timed(samples, "analyze_image", visguide.analyze_image)
+    visguide.play_audio = timed(samples, "play_audio", visguide.play_audio)
+    handlers = {
+        "single": lambda: visguide.handle_single_press(0.1),
+        "double": visguide.handle_double_press,
+    }
+
+    for i in range(args.warmup + args.iterations):
+        if i == args.warmup:
+            samples.clear()
+        visguide.script = []
+        visguide.timings = {'image_encoding': 0, 'analysis': 0, 'audio_playback': 0, 'first_audio': 0, 'deadline_misses': 0}
+        sink.reset()
+
+        # Press to first audio, through the real handler and single_loop
+        press = time.time()
+        handlers[args.gesture]()
+        samples.setdefault(f"{args.gesture}_press_handler", []).append(time.time() - press)
+        visguide.single_loop()
+        if sink.first_chunk_time is not None:
+            samples.setdefault("press_to_first_audio", []).append(sink.first_chunk_time - press)
+        samples.setdefault("deadline_misses", []).append(visguide.timings['deadline_misses'])
+
+        # The mode and style handlers run on the button thread, they should return straight away
+        if args.gestures:
+            for name, handler in (("triple_press_handler", visguide.handle_triple_press), ("long_press_handler", visguide.handle_long_press)):
+                start = time.time()
+                handler()
+                samples.setdefault(name, []).append(time.time() - start)
+
+    misses = samples.pop("deadline_misses", [])
+    rows = summarise(samples)
+    print_table(rows)
+    print(f"deadline misses: {sum(misses)} of {len(misses)} presses (budget {visguide.E2E_BUDGET:.1f} s)")
+    print(f"mean request size: {sum(server.request_bytes) / max(1, len(server.request_bytes)) / 1024:.1f} KB")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "stages": rows, "deadline_misses": sum(misses)}, f, indent=2)
+    visguide.config.close()
+    server.stop()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Press to first audio benchmark for visguide.py")
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    parser.add_argument("-w", "--warmup", type=int, default=2)
+    parser.add_argument("-f", "--frames", type=str, default=os.path.join(REPO_DIR, "image.jpeg"), help="Video file, image or directory of images")
+    parser.add_argument("-g", "--gesture", choices=("single", "double"), default="single")
+    parser.add_argument("--gestures", action="store_true", help="Also time the triple and long press handlers")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Seconds before the fake OpenAI answers")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="Seconds before the fake ElevenLabs sends audio")
+    parser.add_argument("--tts-chunks", type=int, default=8)
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of random latency jitter")
+    parser.add_argument("--json", type=str, help="Write the results to this file")
+    parser.add_argument("--scene-cache", action="store_true", help="Turn the scene cache on (repeated frames are answered from it), it only serves Tourist narrations so use with --gesture double")
+    parser.add_argument("--record", type=str, help="Also record the session to this directory (see replay_session.py)")
+    run(parser.parse_args())
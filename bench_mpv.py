@@ -0,0 +1,327 @@
+import sys
+import json
+import time
+import argparse
+from ctypes import byref, create_string_buffer, memmove
+
+### This is bench_mpv.py ###
+# Microbenchmarks for the hot paths of the bundled mpv.py, run on the Pi before and after a change.
+#   python bench_mpv.py              (everything)
+#   python bench_mpv.py stream copy  (just these)
+# Benchmarks marked libmpv need libmpv installed, the others run anywhere.
+
+MB = 1024 * 1024
+
+
+# FUNC: Best of repeat runs of fn(), in seconds
+def best_time(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# FUNC: A player for benchmarking, no audio or video output and no config files
+def make_player(**options):
+    import mpv
+    return mpv.MPV(ao="null", vo="null", config=False, **options)
+
+
+# Copying a chunk into a C buffer: the old per byte loop against one memmove (no libmpv needed)
+def bench_copy(args):
+    buf = create_string_buffer(args.read_size)
+    data = bytes(args.read_size)
+    copies = max(1, 4 * MB // args.read_size)
+
+    def per_byte():
+        for _ in range(copies):
+            for i in range(len(data)):
+                buf[i] = data[i]
+
+    def bulk():
+        for _ in range(copies):
+            memmove(buf, data, len(data))
+
+    megabytes = copies * args.read_size / MB
+    return [
+        ("copy per byte", megabytes / best_time(per_byte, 1), "MB/s"),
+        ("copy memmove", megabytes / best_time(bulk), "MB/s"),
+    ]
+
+
+# A python:// stream read through the registered callbacks exactly as libmpv calls them (libmpv)
+def bench_stream(args):
+    import mpv
+    player = make_player()
+    chunk = bytes(args.chunk_size)
+    chunks = max(1, args.megabytes * MB // args.chunk_size)
+
+    @player.python_stream("bench")
+    def reader():
+        for _ in range(chunks):
+            yield chunk
+
+    open_stream = player._stream_protocol_cbs["python"][0]
+    buf = create_string_buffer(args.read_size)
+
+    def read_all():
+        info = mpv.StreamCallbackInfo()
+        if open_stream(None, b"python://bench", byref(info)) != 0:
+            raise RuntimeError("Couldn't open the python:// stream")
+        info.seek(None, 0)
+        total = 0
+        while True:
+            n = info.read(None, buf, args.read_size)
+            if n <= 0:
+                break
+            total += n
+        info.close(None)
+        return total
+
+    seconds = best_time(read_all)
+    reader.unregister()
+    player.terminate()
+    return [(f"python:// read ({args.read_size} B reads)", chunks * args.chunk_size / MB / seconds, "MB/s")]
+
+
+# Stream adapters on big chunks: GeneratorStream re-slices the rest of its chunk on every read, ChunkStream
+# reads it in place (libmpv)
+def bench_adapter(args):
+    import mpv
+    chunk = bytes(args.adapter_chunk)
+    chunks = max(1, args.megabytes * MB // args.adapter_chunk)
+    buf = create_string_buffer(args.read_size)
+    view = memoryview(buf).cast("B")
+
+    def generator():
+        for _ in range(chunks):
+            yield chunk
+
+    def generator_stream():
+        stream = mpv.GeneratorStream(generator)
+        stream.seek(0)
+        while True:
+            data = stream.read(args.read_size)
+            if not data:
+                break
+            memmove(buf, data, len(data))
+
+    def chunk_stream():
+        stream = mpv.ChunkStream(generator)
+        stream.seek(0)
+        while stream.readinto(view):
+            pass
+
+    megabytes = chunks * args.adapter_chunk / MB
+    return [
+        (f"GeneratorStream ({args.adapter_chunk // 1024} KB chunks)", megabytes / best_time(generator_stream, 1), "MB/s"),
+        (f"ChunkStream ({args.adapter_chunk // 1024} KB chunks)", megabytes / best_time(chunk_stream), "MB/s"),
+    ]
+
+
+# Polling properties: a libmpv round trip per read, a bulk read and the observer-backed cache (libmpv)
+def bench_property(args):
+    player = make_player(idle=True)
+    names = ("volume", "core_idle", "pause")
+    reads = args.reads
+
+    def direct():
+        for _ in range(reads // len(names)):
+            for name in names:
+                getattr(player, name)
+
+    def cached():
+        for _ in range(reads // len(names)):
+            for name in names:
+                getattr(player.cached, name)
+
+    def bulk():
+        for _ in range(reads // len(names)):
+            player.get_properties(*names)
+
+    player.cache_property(*names)
+    player.wait_for_property("volume", lambda value: value is not None)
+    # Let the first values arrive so the cached reads are all hits
+    time.sleep(0.1)
+    results = [
+        ("property get", reads / best_time(direct), "reads/s"),
+        ("property get (bulk)", reads / best_time(bulk), "reads/s"),
+        ("property get (cached)", reads / best_time(cached), "reads/s"),
+    ]
+    player.terminate()
+    return results
+
+
+# Per call cost of a frequent command: MPV.command rebuilding its node arrays against a prepared command (libmpv)
+def bench_command(args):
+    player = make_player(idle=True)
+    show_text = player.prepare_command("show-text", ..., 1000)
+    calls = args.calls
+
+    def direct():
+        for i in range(calls):
+            player.command("show-text", "Person ahead", 1000)
+
+    def prepared():
+        for i in range(calls):
+            show_text("Person ahead")
+
+    results = [
+        ("command", best_time(direct) / calls * 1e6, "us/call"),
+        ("command (prepared)", best_time(prepared) / calls * 1e6, "us/call"),
+    ]
+    player.terminate()
+    return results
+
+
+# Overlay updates with camera sized frames: ImageOverlay's PIL path against ArrayOverlay (libmpv, numpy, Pillow)
+def bench_overlay(args):
+    import numpy as np
+    from PIL import Image
+    player = make_player(idle=True)
+    w, h = args.overlay_size
+    frame = np.zeros((h, w, 4), dtype=np.uint8)
+    image = Image.fromarray(frame, "RGBA")
+    updates = 100
+
+    image_overlay = player.create_image_overlay()
+    array_overlay = player.create_array_overlay(size=(w, h))
+
+    def pil():
+        for _ in range(updates):
+            image_overlay.update(image)
+
+    def array():
+        for _ in range(updates):
+            array_overlay.update(frame)
+
+    def in_place():
+        for _ in range(updates):
+            array_overlay.back_buffer[...] = 0
+            array_overlay.update()
+
+    results = [
+        (f"ImageOverlay ({w}x{h})", updates / best_time(pil), "updates/s"),
+        (f"ArrayOverlay ({w}x{h})", updates / best_time(array), "updates/s"),
+        (f"ArrayOverlay in place ({w}x{h})", updates / best_time(in_place), "updates/s"),
+    ]
+    player.terminate()
+    return results
+
+
+# Node decoding on big replies: MPV.properties (property-list, then option-info for every name) (libmpv)
+def bench_decode(args):
+    player = make_player(idle=True)
+    names = player.property_list
+    results = [
+        (f"MPV.properties ({len(names)} names)", best_time(lambda: player.properties) * 1e3, "ms"),
+        ("property-list", best_time(lambda: [player.property_list for _ in range(100)]) * 10, "ms"),
+    ]
+    player.terminate()
+    return results
+
+
+# Event loop throughput: client messages through the event thread, with and without many waiters parked on
+# other event types (libmpv)
+def bench_events(args):
+    import threading
+    results = []
+    for waiters in (0, args.waiters):
+        player = make_player(idle=True)
+        for _ in range(waiters):
+            player.event_callback("end-file", "file-loaded")(lambda event: None)
+        received = 0
+        done = threading.Event()
+
+        @player.event_callback("client-message")
+        def counter(event):
+            nonlocal received
+            received += 1
+            if received == args.events:
+                done.set()
+
+        def fire():
+            nonlocal received
+            received = 0
+            done.clear()
+            for _ in range(args.events):
+                player.command("script-message", "bench")
+            done.wait()
+
+        results.append((f"events ({waiters} waiters)", args.events / best_time(fire), "events/s"))
+        player.terminate()
+    return results
+
+
+# A python:// stream played by libmpv as raw audio into the null output, as fast as it will go (libmpv)
+def bench_playback(args):
+    player = make_player(demuxer="rawaudio", ao_null_untimed=True)
+    chunk = bytes(args.chunk_size)
+    chunks = max(1, args.megabytes * MB // args.chunk_size)
+
+    @player.python_stream("playback")
+    def reader():
+        for _ in range(chunks):
+            yield chunk
+
+    def play():
+        player.play("python://playback")
+        player.wait_for_playback()
+
+    seconds = best_time(play)
+    reader.unregister()
+    player.terminate()
+    return [("python:// playback", chunks * args.chunk_size / MB / seconds, "MB/s")]
+
+
+BENCHMARKS = {
+    "copy": bench_copy,
+    "stream": bench_stream,
+    "adapter": bench_adapter,
+    "property": bench_property,
+    "events": bench_events,
+    "command": bench_command,
+    "overlay": bench_overlay,
+    "decode": bench_decode,
+    "playback": bench_playback,
+}
+
+
+def run(args):
+    rows = []
+    for name in args.benchmarks or list(BENCHMARKS):
+        try:
+            results = BENCHMARKS[name](args)
+        except OSError as e:
+            # libmpv not installed
+            print(f"{name}: skipped ({e})", file=sys.stderr)
+            continue
+        for label, value, unit in results:
+            rows.append({"benchmark": label, "value": value, "unit": unit})
+            print(f"{label:<40}{value:>14.2f} {unit}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": rows}, f, indent=2)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks for mpv.py")
+    parser.add_argument("benchmarks", nargs="*", help=f"Benchmarks to run: {', '.join(BENCHMARKS)} (default all)")
+    parser.add_argument("--megabytes", type=int, default=16, help="Size of the test streams")
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024, help="Size of the chunks the stream generator yields")
+    parser.add_argument("--adapter-chunk", type=int, default=1024 * 1024, help="Chunk size for the adapter benchmark")
+    parser.add_argument("--read-size", type=int, default=4096, help="Size of each libmpv read")
+    parser.add_argument("--reads", type=int, default=30000, help="Property reads per run")
+    parser.add_argument("--events", type=int, default=5000, help="Client messages per run of the events benchmark")
+    parser.add_argument("--waiters", type=int, default=200, help="Idle event callbacks registered in the events benchmark")
+    parser.add_argument("--calls", type=int, default=20000, help="Commands per run of the command benchmark")
+    parser.add_argument("--overlay-size", type=int, nargs=2, default=(640, 480), metavar=("W", "H"), help="Frame size for the overlay benchmark")
+    parser.add_argument("--json", type=str, help="Write the results to this file")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+    run(args)
@@ -0,0 +1,112 @@
+import sys
+import json
+import time
+import random
+import argparse
+import cv2
+import numpy as np
+import obstacle
+
+### This is bench_obstacle.py ###
+# Checks that the hazard monitor's frame budget settles and the looming cue still fires, without a camera.
+# Synthetic frames show a textured object growing towards the camera over and over, the detector gets an
+# extra delay per frame that grows with the analysis width like the optical flow does on a Pi, and
+# --read-delay stands in for capture_image holding the camera lock. It prints the analysis widths over
+# time and the cues, and exits 1 if the width still changes in the second half of the run or no cue fired, e.g.
+#   python bench_obstacle.py --cost 0.9 --read-delay 0.1 --seconds 12
+
+
+# FUNC: Smoothed noise, something for the optical flow to track
+def texture(height, width, rng, blur=3):
+    noise = cv2.GaussianBlur((rng.random((height, width)) * 255).astype(np.uint8), (0, 0), blur)
+    return cv2.normalize(noise, None, 0, 255, cv2.NORM_MINMAX)
+
+
+class LoomingScene:
+    """Frames of an object straight ahead coming closer, starting again every approach seconds."""
+
+    def __init__(self, approach=2.0, closest=0.5, size=200, width=320, height=240, seed=1):
+        rng = np.random.default_rng(seed)
+        self.background = texture(height, width, rng)
+        self.object = texture(120, 120, rng, blur=2)
+        self.approach = approach
+        self.closest = closest
+        self.size = size
+        self.start = time.time()
+
+    # Apparent size goes with 1 / distance, so with 1 / time to contact at a steady walking speed
+    def frame(self):
+        ttc = self.approach + self.closest - (time.time() - self.start) % self.approach
+        size = int(min(4 * self.background.shape[1], self.size * 1.5 / ttc))
+        img = self.background.copy()
+        obj = cv2.resize(self.object, (size, size), interpolation=cv2.INTER_LINEAR)
+        h, w = img.shape
+        y0, x0 = h * 5 // 8 - size // 2, w // 2 - size // 2
+        ys, xs, ye, xe = max(0, y0), max(0, x0), min(h, y0 + size), min(w, x0 + size)
+        img[ys:ye, xs:xe] = obj[ys - y0:ye - y0, xs - x0:xe - x0]
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+
+class SlowDetector(obstacle.LoomingDetector):
+    """LoomingDetector plus cost seconds of work per optical flow at width 64, scaled with the pixel count.
+    The first frame after a reset only gets resized, so it stays cheap."""
+
+    def __init__(self, cost, **kwargs):
+        super().__init__(**kwargs)
+        self.cost = cost
+
+    def update(self, frame, now=None):
+        if self._prev is not None and self._prev.shape[1] == self.width:
+            time.sleep(self.cost * (self.width / 64.0) ** 2)
+        return super().update(frame, now)
+
+
+def run(args):
+    scene = LoomingScene(approach=args.approach)
+    cues, widths = [], []
+
+    def read_frame():
+        # Waiting for the camera lock while a capture is in progress
+        if args.read_delay:
+            time.sleep(random.uniform(0, 2 * args.read_delay))
+        return scene.frame()
+
+    monitor = obstacle.HazardMonitor(read_frame, lambda ttc: cues.append((time.time() - scene.start, ttc)),
+                                     frame_budget=args.budget)
+    monitor.detector = SlowDetector(args.cost * args.budget, width=args.width)
+    monitor.start()
+    end = scene.start + args.seconds
+    while time.time() < end:
+        widths.append((time.time() - scene.start, monitor.detector.width))
+        time.sleep(args.budget / 2)
+    monitor.stop()
+    monitor.join()
+
+    changes = [(t, width) for i, (t, width) in enumerate(widths) if i == 0 or width != widths[i - 1][1]]
+    print("analysis width: " + ", ".join(f"{width} at {t:.1f}s" for t, width in changes))
+    print("cues: " + (", ".join(f"ttc {ttc:.2f}s at {t:.1f}s" for t, ttc in cues) or "none"))
+    print(f"budget overruns: {monitor.overruns}")
+    problems = []
+    if changes[-1][0] > args.seconds / 2:
+        problems.append(f"analysis width still changing at {changes[-1][0]:.1f}s")
+    if not cues:
+        problems.append("no looming cue fired")
+    for problem in problems:
+        print(f"FAIL {problem}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "widths": changes, "cues": cues, "overruns": monitor.overruns,
+                       "problems": problems}, f, indent=2)
+    return not problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hazard monitor frame budget and looming cue check")
+    parser.add_argument("--seconds", type=float, default=12.0)
+    parser.add_argument("--budget", type=float, default=obstacle.FRAME_BUDGET, help="Seconds per analysed frame")
+    parser.add_argument("--cost", type=float, default=0.9, help="Extra detector work per frame at width 64, as a fraction of the budget")
+    parser.add_argument("--read-delay", type=float, default=0.0, help="Mean seconds spent waiting for a frame")
+    parser.add_argument("--width", type=int, default=64, help="Starting analysis width")
+    parser.add_argument("--approach", type=float, default=2.0, help="Seconds per approach of the object")
+    parser.add_argument("--json", type=str, help="Write the results to this file")
+    sys.exit(0 if run(parser.parse_args()) else 1)
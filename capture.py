@@ -1,15 +1,9 @@
 import cv2
 import time
-from PIL import Image
-import numpy as np
-import os
+from frame_channel import FrameChannel
 
-# Folder
-folder = "frames"
-
-# Create the frames folder if it doesn't exist
-frames_dir = os.path.join(os.getcwd(), folder)
-os.makedirs(frames_dir, exist_ok=True)
+# Publish frames through shared memory, visguide-api.py reads the latest one from there
+channel = FrameChannel.create()
 
 # Initialize the webcam
 cap = cv2.VideoCapture(0)
@@ -24,22 +18,15 @@ time.sleep(2)
 while True:
     ret, frame = cap.read()
     if ret:
-        # Convert the frame to a PIL image
-        pil_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-
-        # Resize the image
+        # Resize the image, straight on the OpenCV frame rather than through PIL and back
         max_size = 250
-        ratio = max_size / max(pil_img.size)
-        new_size = tuple([int(x*ratio) for x in pil_img.size])
-        resized_img = pil_img.resize(new_size, Image.LANCZOS)
-
-        # Convert the PIL image back to an OpenCV image
-        frame = cv2.cvtColor(np.array(resized_img), cv2.COLOR_RGB2BGR)
+        ratio = max_size / max(frame.shape[:2])
+        new_size = (int(frame.shape[1] * ratio), int(frame.shape[0] * ratio))
+        frame = cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
 
-        # Save the frame as an image file
-        print("📸 Say cheese! Saving frame.")
-        path = f"{folder}/frame.jpg"
-        cv2.imwrite(path, frame)
+        # Publish the frame as a JPEG
+        print("📸 Say cheese! Publishing frame.")
+        channel.publish(cv2.imencode('.jpg', frame)[1])
     else:
         print("Failed to capture image")
 
@@ -47,5 +34,6 @@ while True:
     time.sleep(2)
 
 # Release the camera and close all windows
+channel.close()
 cap.release()
 cv2.destroyAllWindows()
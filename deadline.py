@@ -0,0 +1,138 @@
+import time
+import queue
+import random
+import logging
+import threading
+
+### This is deadline.py ###
+# Deadlines, retries with jittered backoff and cancellation for the network stages of VisGuide.
+# A hung OpenAI or ElevenLabs connection must never leave the user in silence.
+
+logger = logging.getLogger()
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Deadline:
+    """A point in time work has to finish by, optionally tied to a cancel event (e.g. a new button press)."""
+
+    def __init__(self, budget, start=None, cancel_event=None):
+        self.budget = budget
+        self.start = time.time() if start is None else start
+        self.expires = self.start + budget
+        self.cancel_event = cancel_event
+
+    def remaining(self):
+        return max(0.0, self.expires - time.time())
+
+    def expired(self):
+        return time.time() >= self.expires
+
+    def cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def check(self, stage="request"):
+        if self.cancelled():
+            raise Cancelled(f"{stage} cancelled")
+        if self.expired():
+            raise DeadlineExceeded(f"{stage} missed its {self.budget:.1f} second deadline")
+
+    # Sleep for delay seconds, waking straight away if cancelled
+    def sleep(self, delay):
+        if self.cancel_event is not None:
+            if self.cancel_event.wait(delay):
+                raise Cancelled("cancelled while waiting to retry")
+        else:
+            time.sleep(delay)
+
+
+# FUNC: Full jitter exponential backoff delay for the given attempt
+def backoff_delay(attempt, base_delay=0.25, max_delay=2.0):
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+# FUNC: Call fn(timeout) until it succeeds, the attempts run out or the deadline passes
+# Each attempt gets at most attempt_timeout seconds (default half the budget) to pass on as its own request
+# timeout, so a hung connection is given up on and retried while there is still time. An attempt timing out
+# is retried like any other error, only the overall deadline (or a cancel) is final.
+def retry_call(fn, deadline, attempts=3, attempt_timeout=None, base_delay=0.25, max_delay=2.0, stage="request"):
+    if attempt_timeout is None:
+        attempt_timeout = deadline.budget / 2
+    for attempt in range(attempts):
+        deadline.check(stage)
+        try:
+            return fn(min(attempt_timeout, deadline.remaining()))
+        except Cancelled:
+            raise
+        except Exception as e:
+            try:
+                deadline.check(stage)
+            except DeadlineExceeded as exceeded:
+                raise exceeded from e
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            if attempt == attempts - 1 or delay >= deadline.remaining():
+                raise
+            logger.warning(f"{stage} failed ({e}), retrying in {delay:.2f} seconds")
+            deadline.sleep(delay)
+
+
+class _End:
+    pass
+
+
+# FUNC: Iterate over a (network) generator from a pump thread so every chunk has a timeout
+# The first chunk has to arrive before the deadline, after that each chunk gets chunk_timeout seconds.
+# If the deadline's cancel event is set iteration stops straight away; the pump thread is left to drain.
+def iter_with_deadline(generator, deadline, chunk_timeout=5.0, stage="stream"):
+    chunks = queue.Queue(maxsize=64)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def pump():
+        try:
+            for chunk in generator:
+                if stop.is_set():
+                    return
+                put(chunk)
+            put(_End)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=pump, daemon=True).start()
+    first = True
+    try:
+        while True:
+            give_up = deadline.expires if first else time.time() + chunk_timeout
+            # Wake up regularly so a cancel is noticed quickly
+            while True:
+                if deadline.cancelled():
+                    raise Cancelled(f"{stage} cancelled")
+                now = time.time()
+                if now >= give_up:
+                    raise DeadlineExceeded(f"{stage} stalled")
+                try:
+                    item = chunks.get(timeout=min(0.1, give_up - now))
+                    break
+                except queue.Empty:
+                    pass
+            if item is _End:
+                return
+            if isinstance(item, Exception):
+                raise item
+            first = False
+            yield item
+    finally:
+        stop.set()
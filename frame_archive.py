@@ -0,0 +1,196 @@
+import os
+import re
+import mmap
+import queue
+import struct
+import logging
+import threading
+from collections import deque
+
+### This is frame_archive.py ###
+# Writes captured frames to disk on a background thread so the capture never waits for the SD card.
+# Frames are written in batches and only a rolling window is kept (by count and/or bytes).
+# Instead of one file per frame the archive can use a single pre-allocated, memory-mapped segment file
+# split into fixed size slots, which avoids creating and deleting files (metadata churn) on the SD card.
+
+logger = logging.getLogger()
+
+SLOT_MAGIC = 0x56474652  # "VGFR"
+SLOT_HEADER = struct.Struct("<IIQ")  # magic, length, sequence number
+SEGMENT_NAME = "frames.seg"
+FRAME_NAME = re.compile(r"frame(\d+)\.jpg")
+
+
+class FrameSegment:
+    """A pre-allocated file of fixed size slots used as a ring, each slot holds one frame."""
+
+    def __init__(self, path, slots=50, slot_size=64 * 1024):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        size = slots * slot_size
+        with open(path, "a+b") as f:
+            if os.path.getsize(path) != size:
+                f.truncate(size)
+        self.file = open(path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), size)
+        # Carry on after the newest frame from a previous run
+        self.last_seq, self.next_slot = 0, 0
+        for slot in range(slots):
+            magic, _, seq = SLOT_HEADER.unpack_from(self.map, slot * slot_size)
+            if magic == SLOT_MAGIC and seq > self.last_seq:
+                self.last_seq, self.next_slot = seq, (slot + 1) % slots
+
+    def write(self, seq, data):
+        if len(data) + SLOT_HEADER.size > self.slot_size:
+            logger.warning(f"Frame of {len(data)} bytes is too big for a {self.slot_size} byte archive slot")
+            return False
+        offset = self.next_slot * self.slot_size
+        # Invalidate the slot first so a reader never sees a new header with old data
+        self.map[offset:offset + SLOT_HEADER.size] = bytes(SLOT_HEADER.size)
+        self.map[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + len(data)] = data
+        self.map[offset:offset + SLOT_HEADER.size] = SLOT_HEADER.pack(SLOT_MAGIC, len(data), seq)
+        self.next_slot = (self.next_slot + 1) % self.slots
+        return True
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+# FUNC: Read the frames back from a segment file, oldest first, as (sequence number, jpeg bytes)
+def read_segment(path, slot_size=64 * 1024):
+    frames = []
+    with open(path, "rb") as f:
+        data = f.read()
+    for offset in range(0, len(data) - SLOT_HEADER.size + 1, slot_size):
+        magic, length, seq = SLOT_HEADER.unpack_from(data, offset)
+        if magic == SLOT_MAGIC and length <= slot_size - SLOT_HEADER.size:
+            start = offset + SLOT_HEADER.size
+            frames.append((seq, data[start:start + length]))
+    return sorted(frames)
+
+
+class FrameArchive(threading.Thread):
+    """Background frame writer. add() never blocks; if the writer falls behind new frames are dropped.
+
+    max_frames / max_bytes bound the rolling window (None keeps everything). Frames left in the directory
+    by earlier runs count towards the window, and numbering carries on after the newest of them. With
+    segment=True the frames go into one memory-mapped segment file of max_frames slots instead.
+    """
+
+    def __init__(self, directory, max_frames=50, max_bytes=None, segment=False, slot_size=64 * 1024,
+                 batch_size=8, flush_interval=1.0, queue_size=32):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.kept = deque()
+        self.kept_bytes = 0
+        self.seq = 0
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+        self.segment = FrameSegment(os.path.join(directory, SEGMENT_NAME), max_frames or 50, slot_size) if segment else None
+        if self.segment:
+            self.seq = self.segment.last_seq
+        else:
+            self._load_existing()
+        self.start()
+
+    # Pick up the frames of earlier runs, oldest first, and trim them to the window
+    def _load_existing(self):
+        existing = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or not entry.name.endswith(".jpg"):
+                continue
+            match = FRAME_NAME.fullmatch(entry.name)
+            if match:
+                self.seq = max(self.seq, int(match.group(1)))
+            stat = entry.stat()
+            existing.append((stat.st_mtime, entry.path, stat.st_size))
+        if self.bounded:
+            for _, path, size in sorted(existing):
+                self.kept.append((path, size))
+                self.kept_bytes += size
+            self._roll()
+
+    @property
+    def bounded(self):
+        return bool(self.max_frames or self.max_bytes)
+
+    # Queue a JPEG for writing, name defaults to frame<n>.jpg. Returns the name or None if dropped
+    def add(self, jpeg_bytes, name=None):
+        self.seq += 1
+        name = name or f"frame{self.seq}.jpg"
+        try:
+            self.queue.put_nowait((self.seq, name, bytes(jpeg_bytes)))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return name
+
+    def _write_file(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        # Without a bound nothing is ever removed, so there is nothing to track
+        if self.bounded:
+            self.kept.append((path, len(data)))
+            self.kept_bytes += len(data)
+            self._roll()
+
+    def _roll(self):
+        while self.kept and ((self.max_frames and len(self.kept) > self.max_frames)
+                             or (self.max_bytes and self.kept_bytes > self.max_bytes)):
+            old_path, old_size = self.kept.popleft()
+            self.kept_bytes -= old_size
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+
+    def _write_batch(self, batch):
+        for seq, name, data in batch:
+            try:
+                if self.segment:
+                    self.segment.write(seq, data)
+                else:
+                    self._write_file(name, data)
+            except Exception as e:
+                logger.error(f"Error archiving frame {name}: {e}")
+        if self.segment:
+            self.segment.flush()
+        logger.debug(f"Archived {len(batch)} frames to {self.directory}")
+
+    def run(self):
+        closing = False
+        while not closing:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # Take whatever else is already queued, up to a batch
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                closing = True
+                batch = [item for item in batch if item is not None]
+            if batch:
+                self._write_batch(batch)
+        if self.segment:
+            self.segment.close()
+
+    # Write everything queued and stop
+    def close(self, timeout=5):
+        self.queue.put(None)
+        self.join(timeout)
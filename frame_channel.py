@@ -0,0 +1,112 @@
+import time
+import struct
+from multiprocessing import shared_memory, resource_tracker
+
+### This is frame_channel.py ###
+# Hands the latest camera frame from capture.py (producer) to visguide-api.py (consumers) through shared
+# memory instead of frames/frame.jpg, so there are no filesystem round trips, half written JPEGs or
+# EACCES retry sleeps.
+#
+# The shared memory holds a header and a small ring of slots. Each slot is guarded by a sequence number
+# (a seqlock): the producer makes it odd while it writes and even when the frame is complete, and the
+# consumer only accepts a copy if the sequence number was the same even value before and after copying.
+# The producer never overwrites the slot it just published, so readers almost never have to retry.
+
+CHANNEL_NAME = "visguide_frames"
+MAGIC = 0x56474348  # "VGCH"
+HEADER = struct.Struct("<IIIIQQ")  # magic, slots, slot size, pad, latest sequence number, latest slot
+SLOT_HEADER = struct.Struct("<QQ")  # slot sequence number (odd while writing), frame length
+
+
+class FrameChannel:
+    """Latest-frame channel in shared memory. Use FrameChannel.create() in the producer and
+    FrameChannel.attach() in the consumers."""
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.buf = shm.buf
+        magic, self.slots, self.slot_size, _, _, _ = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Shared memory {shm.name} is not a VisGuide frame channel")
+        self.seq = 0
+
+    @classmethod
+    def create(cls, name=CHANNEL_NAME, slots=3, slot_size=256 * 1024):
+        size = HEADER.size + slots * (SLOT_HEADER.size + slot_size)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a producer that didn't shut down cleanly
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            old.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        shm.buf[:size] = bytes(size)
+        HEADER.pack_into(shm.buf, 0, MAGIC, slots, slot_size, 0, 0, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name=CHANNEL_NAME):
+        shm = shared_memory.SharedMemory(name=name)
+        # Stop the resource tracker unlinking the producer's memory when this consumer exits
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    def _slot_offset(self, slot):
+        return HEADER.size + slot * (SLOT_HEADER.size + self.slot_size)
+
+    # Producer: publish a complete JPEG, returns its sequence number
+    def publish(self, data):
+        data = memoryview(data).cast("B")
+        if len(data) > self.slot_size:
+            raise ValueError(f"Frame of {len(data)} bytes is bigger than the {self.slot_size} byte slot")
+        _, _, _, _, latest_seq, latest_slot = HEADER.unpack_from(self.buf, 0)
+        seq = latest_seq + 1
+        slot = (latest_slot + 1) % self.slots if latest_seq else 0
+        offset = self._slot_offset(slot)
+        SLOT_HEADER.pack_into(self.buf, offset, 2 * seq - 1, 0)
+        start = offset + SLOT_HEADER.size
+        self.buf[start:start + len(data)] = data
+        SLOT_HEADER.pack_into(self.buf, offset, 2 * seq, len(data))
+        HEADER.pack_into(self.buf, 0, MAGIC, self.slots, self.slot_size, 0, seq, slot)
+        return seq
+
+    # Consumer: the newest complete frame as (seq, bytes), or (None, None) if nothing newer than after_seq
+    def latest(self, after_seq=0):
+        for _ in range(self.slots + 1):
+            _, _, _, _, latest_seq, latest_slot = HEADER.unpack_from(self.buf, 0)
+            if latest_seq <= after_seq:
+                return None, None
+            offset = self._slot_offset(latest_slot)
+            before, length = SLOT_HEADER.unpack_from(self.buf, offset)
+            if before % 2 == 0 and before:
+                start = offset + SLOT_HEADER.size
+                data = bytes(self.buf[start:start + length])
+                after, _ = SLOT_HEADER.unpack_from(self.buf, offset)
+                if after == before:
+                    # The header was read before the slot, check what is actually in the slot is still new
+                    if before // 2 <= after_seq:
+                        return None, None
+                    return before // 2, data
+        # The producer lapped us every time, treat it as no new frame
+        return None, None
+
+    # Consumer: block until a frame newer than after_seq (default: the last one returned) is available
+    def wait_for_frame(self, after_seq=None, timeout=None, poll=0.01):
+        after_seq = self.seq if after_seq is None else after_seq
+        give_up = None if timeout is None else time.time() + timeout
+        while True:
+            seq, data = self.latest(after_seq)
+            if seq is not None:
+                self.seq = seq
+                return seq, data
+            if give_up is not None and time.time() >= give_up:
+                return None, None
+            time.sleep(poll)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,79 @@
+import os
+import cv2
+
+### This is frame_source.py ###
+# Where frames come from. The live webcam by default, or a video file / image directory / single image
+# so VisGuide, the benchmarks and the batch tools can run without a camera.
+# Everything returned here behaves like cv2.VideoCapture: read(), isOpened() and release().
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class ImageSource:
+    """Serves a list of images as camera frames, looping back to the first one at the end if loop is set."""
+
+    def __init__(self, paths, loop=True):
+        self.paths = list(paths)
+        self.loop = loop
+        self.index = 0
+        self._cache = {}
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def read(self):
+        if self.index >= len(self.paths):
+            if not self.loop or not self.paths:
+                return False, None
+            self.index = 0
+        path = self.paths[self.index]
+        self.index += 1
+        # Decode each file once, a benchmark shouldn't be measuring the SD card
+        if path not in self._cache:
+            self._cache[path] = cv2.imread(path)
+        frame = self._cache[path]
+        return frame is not None, None if frame is None else frame.copy()
+
+    def release(self):
+        self._cache.clear()
+
+
+class VideoFileSource:
+    """A video file as a camera, rewinding at the end if loop is set."""
+
+    def __init__(self, path, loop=True):
+        self.cap = cv2.VideoCapture(path)
+        self.loop = loop
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+# FUNC: List the images in a directory in name order
+def list_images(directory):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+# FUNC: Open a frame source from a spec: a camera index ("0"), a directory of images, an image or a video file
+def open_frame_source(spec=0, loop=True):
+    spec = str(spec)
+    if spec.isdigit():
+        return cv2.VideoCapture(int(spec))
+    if os.path.isdir(spec):
+        return ImageSource(list_images(spec), loop=loop)
+    if spec.lower().endswith(IMAGE_EXTENSIONS):
+        return ImageSource([spec], loop=loop)
+    return VideoFileSource(spec, loop=loop)
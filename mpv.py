@@ -22,6 +22,7 @@ __version__ = '1.0.5'
 from ctypes import *
 import ctypes.util
 import threading
+import asyncio
 import queue
 import os
 import sys
@@ -30,6 +31,7 @@ from functools import partial, wraps
 from contextlib import contextmanager
 from concurrent.futures import Future, InvalidStateError
 import collections
+import struct
 import re
 import traceback
 
@@ -308,11 +310,10 @@ def lazy_decoder(b):
 
 class MpvNodeList(Structure):
     def array_value(self, decoder=identity_decoder):
-        return [ self.values[i].node_value(decoder) for i in range(self.num) ]
+        return _decode_node_array(addressof(self), decoder)
 
     def dict_value(self, decoder=identity_decoder):
-        return { self.keys[i].decode('utf-8'):
-                self.values[i].node_value(decoder) for i in range(self.num) }
+        return _decode_node_map(addressof(self), decoder)
 
 class MpvByteArray(Structure):
     _fields_ = [('data', c_void_p),
@@ -328,35 +329,11 @@ class MpvByteArray(Structure):
 
 class MpvNode(Structure):
     def node_value(self, decoder=identity_decoder):
-        return MpvNode.node_cast_value(self.val, self.format.value, decoder)
+        return _decode_node_values(addressof(self), 1, decoder)[0]
 
     @staticmethod
     def node_cast_value(v, fmt=MpvFormat.NODE, decoder=identity_decoder):
-        if fmt == MpvFormat.NONE:
-            return None
-        elif fmt == MpvFormat.STRING:
-            return decoder(v.string)
-        elif fmt == MpvFormat.OSD_STRING:
-            return v.string.decode('utf-8')
-        elif fmt == MpvFormat.FLAG:
-            return bool(v.flag)
-        elif fmt == MpvFormat.INT64:
-            return v.int64
-        elif fmt == MpvFormat.DOUBLE:
-            return v.double
-        else:
-            if not v.node: # Check for null pointer
-                return None
-            if fmt == MpvFormat.NODE:
-                return v.node.contents.node_value(decoder)
-            elif fmt == MpvFormat.NODE_ARRAY:
-                return v.list.contents.array_value(decoder)
-            elif fmt == MpvFormat.NODE_MAP:
-                return v.map.contents.dict_value(decoder)
-            elif fmt == MpvFormat.BYTE_ARRAY:
-                return v.byte_array.contents.bytes_value()
-            else:
-                raise TypeError('Unknown MPV node format {}. Please submit a bug report.'.format(fmt))
+        return _decode_node_union(bytes(v), fmt, decoder)
 
 class MpvNodeUnion(Union):
     _fields_ = [('string', c_char_p),
@@ -375,6 +352,118 @@ MpvNodeList._fields_ = [('num', c_int),
                         ('values', POINTER(MpvNode)),
                         ('keys', POINTER(c_char_p))]
 
+# Node decoding. The values of a node array or map are unpacked from libmpv's memory with one struct call into (union as int64, format) pairs, scalars and pointers are taken from there and strings are read
+# through a c_char_p view of the same memory. Rarer formats go through a table of decoding functions. This avoids
+# creating ctypes objects per node, which made big replies like track-list or property-list slow to decode.
+_NODE_SIZE          = sizeof(MpvNode)
+_UNION_SIZE         = sizeof(MpvNodeUnion)
+_POINTER_SIZE       = sizeof(c_void_p)
+_POINTER_MASK       = (1 << (8 * _POINTER_SIZE)) - 1
+_NODE_POINTERS      = _NODE_SIZE // _POINTER_SIZE
+_NODE_STRUCT        = struct.Struct(f'{_UNION_SIZE}si{_NODE_SIZE - _UNION_SIZE - sizeof(c_int)}x')
+_NODE_LIST_STRUCT   = struct.Struct('iPP')
+_BYTE_ARRAY_STRUCT  = struct.Struct('Pn')
+_DOUBLE_STRUCT      = struct.Struct('d')
+_FLAG_SIZE          = sizeof(c_int)
+_BYTE_ORDER         = sys.byteorder
+assert _NODE_STRUCT.size == _NODE_SIZE and _NODE_LIST_STRUCT.size == sizeof(MpvNodeList)
+# The fast path reads a node as a little endian int64 followed by the format, as laid out on x86-64 and ARM
+_NODE_FAST          = (_BYTE_ORDER == 'little' and _NODE_SIZE == 16 and _UNION_SIZE == 8
+                       and MpvNode.format.offset == 8)
+_NONE, _STRING, _FLAG, _INT64, _DOUBLE, _NODE_ARRAY, _NODE_MAP = (MpvFormat.NONE, MpvFormat.STRING, MpvFormat.FLAG,
+        MpvFormat.INT64, MpvFormat.DOUBLE, MpvFormat.NODE_ARRAY, MpvFormat.NODE_MAP)
+_values_structs = {}
+
+def _values_struct(num):
+    try:
+        return _values_structs[num]
+    except KeyError:
+        st = struct.Struct('<' + 'qi4x' * num)
+        if num <= 256:
+            _values_structs[num] = st
+        return st
+
+def _decode_node_union(raw, fmt, decoder):
+    try:
+        return _NODE_DECODERS[fmt](raw, decoder)
+    except KeyError:
+        raise TypeError('Unknown MPV node format {}. Please submit a bug report.'.format(fmt)) from None
+
+def _decode_node_values(values, num, decoder):
+    """Decode the array of num nodes at address values."""
+    data = (c_char * (num * _NODE_SIZE)).from_address(values)
+    if not _NODE_FAST:
+        return [ _decode_node_union(raw, fmt, decoder) for raw, fmt in _NODE_STRUCT.iter_unpack(data) ]
+
+    fields = _values_struct(num).unpack_from(data)
+    fmts = fields[1::2]
+    if _STRING in fmts:
+        strings = (c_char_p * (num * _NODE_POINTERS)).from_address(values)
+        if fmts.count(_STRING) == num:
+            # Only strings, e.g. property-list: the slice only dereferences their pointers
+            return list(map(decoder, strings[::_NODE_POINTERS]))
+
+    rv = []
+    append = rv.append
+    for i, fmt in enumerate(fmts):
+        if fmt == _STRING:
+            append(decoder(strings[i * _NODE_POINTERS]))
+        elif fmt == _INT64:
+            append(fields[2*i])
+        elif fmt == _DOUBLE:
+            append(_DOUBLE_STRUCT.unpack_from(data, i * _NODE_SIZE)[0])
+        elif fmt == _FLAG:
+            append(fields[2*i] & 0xffffffff != 0)
+        elif fmt == _NODE_MAP:
+            address = fields[2*i] & _POINTER_MASK
+            append(_decode_node_map(address, decoder) if address else None)
+        elif fmt == _NODE_ARRAY:
+            address = fields[2*i] & _POINTER_MASK
+            append(_decode_node_array(address, decoder) if address else None)
+        elif fmt == _NONE:
+            append(None)
+        else:
+            offset = i * _NODE_SIZE
+            append(_decode_node_union(data[offset:offset + _UNION_SIZE], fmt, decoder))
+    return rv
+
+def _decode_node_array(address, decoder):
+    num, values, _keys = _NODE_LIST_STRUCT.unpack(string_at(address, _NODE_LIST_STRUCT.size))
+    if not num:
+        return []
+    return _decode_node_values(values, num, decoder)
+
+def _decode_node_map(address, decoder):
+    num, values, keys = _NODE_LIST_STRUCT.unpack(string_at(address, _NODE_LIST_STRUCT.size))
+    if not num:
+        return {}
+    keys = map(bytes.decode, (c_char_p * num).from_address(keys)[:])
+    return dict(zip(keys, _decode_node_values(values, num, decoder)))
+
+def _node_pointer(decode):
+    """Decoder for the formats whose union holds a pointer, a null pointer decodes as None."""
+    def decode_pointer(raw, decoder):
+        address = int.from_bytes(raw[:_POINTER_SIZE], _BYTE_ORDER)
+        return decode(address, decoder) if address else None
+    return decode_pointer
+
+def _decode_byte_array(address, decoder):
+    data, size = _BYTE_ARRAY_STRUCT.unpack(string_at(address, _BYTE_ARRAY_STRUCT.size))
+    return string_at(data, size) if size else b''
+
+_NODE_DECODERS = {
+    MpvFormat.NONE:         lambda raw, decoder: None,
+    MpvFormat.STRING:       _node_pointer(lambda address, decoder: decoder(string_at(address))),
+    MpvFormat.OSD_STRING:   _node_pointer(lambda address, decoder: string_at(address).decode('utf-8')),
+    MpvFormat.FLAG:         lambda raw, decoder: int.from_bytes(raw[:_FLAG_SIZE], _BYTE_ORDER) != 0,
+    MpvFormat.INT64:        lambda raw, decoder: int.from_bytes(raw, _BYTE_ORDER, signed=True),
+    MpvFormat.DOUBLE:       lambda raw, decoder: _DOUBLE_STRUCT.unpack(raw)[0],
+    MpvFormat.NODE:         _node_pointer(lambda address, decoder: _decode_node_values(address, 1, decoder)[0]),
+    MpvFormat.NODE_ARRAY:   _node_pointer(_decode_node_array),
+    MpvFormat.NODE_MAP:     _node_pointer(_decode_node_map),
+    MpvFormat.BYTE_ARRAY:   _node_pointer(_decode_byte_array),
+}
+
 class MpvEvent(Structure):
     _fields_ = [('event_id', MpvEventID),
                 ('error', c_int),
@@ -719,6 +808,13 @@ class _DecoderPropertyProxy(_PropertyProxy):
     def __setattr__(self, name, value):
         setattr(self.mpv, _py_to_mpv(name), value)
 
+class _CachedPropertyProxy(_PropertyProxy):
+    def __getattr__(self, name):
+        return self.mpv._get_cached_property(_py_to_mpv(name))
+
+    def __setattr__(self, name, value):
+        setattr(self.mpv, _py_to_mpv(name), value)
+
 class GeneratorStream:
     """Transform a python generator into an mpv-compatible stream object. The total size of the file can be indicated to
     mpv using the size argument to __init__. Seeking is not supported.
@@ -752,6 +848,91 @@ class GeneratorStream:
     def cancel(self):
         self._read_iter = iter([]) # make next read() call return EOF
 
+class ChunkStream:
+    """mpv stream object that fills libmpv's read buffer directly (``readinto``) without re-slicing its input.
+
+    source can be
+     * a generator function, like for GeneratorStream. Chunks are kept in a deque of memoryviews and consumed in
+       place, so large chunks are never copied except into libmpv's buffer.
+     * a file-like object with ``readinto``, e.g. a file opened with ``open(path, 'rb')``. Seeking is supported if the
+       file supports it.
+     * a bytes-like object such as ``bytes`` or an ``mmap.mmap``, read in place with arbitrary seeking.
+    """
+
+    def __init__(self, source, size=None):
+        self._generator_fun = self._file = self._buffer = None
+        if callable(source):
+            self._generator_fun = source
+        elif hasattr(source, 'readinto'):
+            self._file = source
+        else:
+            self._buffer = memoryview(source).cast('B')
+            size = len(self._buffer) if size is None else size
+        self.size = size
+        self._chunks = collections.deque()
+        self._read_iter = iter(())
+        self._pos = 0
+
+    def seek(self, offset):
+        if self._buffer is not None:
+            self._pos = min(max(offset, 0), len(self._buffer))
+            return self._pos
+        if self._file is not None:
+            return self._file.seek(offset)
+        self._read_iter = iter(self._generator_fun())
+        self._chunks.clear()
+        return 0 # Like GeneratorStream, generators can only be seeked to the first byte
+
+    def readinto(self, buf):
+        """Fill buf (a writable bytes-like object) with as much data as is available without blocking on more than
+        one new chunk. Returns the number of bytes written, 0 at EOF."""
+        if self._buffer is not None:
+            n = min(len(buf), len(self._buffer) - self._pos)
+            buf[:n] = self._buffer[self._pos:self._pos+n]
+            self._pos += n
+            return n
+        if self._file is not None:
+            return self._file.readinto(buf) or 0
+
+        pos, want = 0, len(buf)
+        while pos < want:
+            if not self._chunks:
+                # Hand over what we have rather than wait for the generator
+                if pos:
+                    break
+                try:
+                    chunk = next(self._read_iter)
+                except StopIteration:
+                    break
+                if not chunk:
+                    break
+                self._chunks.append(memoryview(chunk).cast('B'))
+            view = self._chunks[0]
+            n = min(len(view), want - pos)
+            buf[pos:pos+n] = view[:n]
+            pos += n
+            if n == len(view):
+                self._chunks.popleft()
+            else:
+                self._chunks[0] = view[n:]
+        return pos
+
+    def read(self, size):
+        buf = bytearray(size)
+        n = self.readinto(buf)
+        return bytes(buf[:n])
+
+    def close(self):
+        self._read_iter = iter(())
+        self._chunks.clear()
+        if self._buffer is not None:
+            # Let go of the source so e.g. an mmap can be closed
+            self._buffer.release()
+            self._buffer = memoryview(b'')
+
+    def cancel(self):
+        self._read_iter = iter(()) # make next read() call return EOF
+
 
 class ImageOverlay:
     def __init__(self, m, overlay_id, img=None, pos=(0, 0)):
@@ -793,6 +974,70 @@ class ImageOverlay:
         self.m.remove_overlay(self.overlay_id)
 
 
+class ArrayOverlay:
+    """Overlay showing BGRA numpy arrays, e.g. camera frames converted with ``cv2.cvtColor(frame,
+    cv2.COLOR_BGR2BGRA)``. Like for ImageOverlay, colours have to be pre-multiplied with the alpha channel.
+
+    The pixels live in two persistent buffers that mpv reads in place. Each update fills the buffer mpv isn't
+    showing and then points the overlay at it, so a frame is never shown half written. ``update(frame)`` costs one
+    copy. To skip that copy as well, write into ``back_buffer`` and call ``update()``::
+
+        cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=overlay.back_buffer)
+        overlay.update()
+    """
+
+    def __init__(self, m, overlay_id, frame=None, pos=(0, 0), size=None):
+        self.m = m
+        self.overlay_id = overlay_id
+        self.pos = pos
+        self._size = None
+        self._buffers = None
+        self._retired = None
+        self._back = 0
+        if size is not None:
+            self._allocate(size)
+        if frame is not None:
+            self.update(frame)
+
+    def _allocate(self, size):
+        import numpy as np
+        w, h = size
+        # mpv may still be showing a buffer of the old size until the next overlay-add
+        self._retired = self._buffers
+        self._buffers = [np.zeros((h, w, 4), dtype=np.uint8) for _ in range(2)]
+        self._size = size
+        self._add = self.m.prepare_command('overlay-add', self.overlay_id, ..., ..., ..., 0, 'bgra', w, h, w*4)
+
+    @property
+    def back_buffer(self):
+        """The (height, width, 4) buffer the next ``update()`` shows."""
+        if self._buffers is None:
+            raise ValueError('Overlay size is not known yet, pass size or a first frame')
+        return self._buffers[self._back]
+
+    def update(self, frame=None, pos=None):
+        if frame is not None:
+            if frame.ndim != 3 or frame.shape[2] != 4 or frame.dtype.itemsize != 1:
+                raise ValueError(f'Expected a (height, width, 4) BGRA uint8 array, got {frame.shape} {frame.dtype}')
+            h, w = frame.shape[:2]
+            if (w, h) != self._size:
+                self._allocate((w, h))
+            if frame is not self.back_buffer:
+                self.back_buffer[...] = frame
+
+        if pos is not None:
+            self.pos = pos
+        x, y = self.pos
+
+        buf = self.back_buffer
+        self._add(x, y, '&' + str(buf.ctypes.data))
+        self._back ^= 1
+        self._retired = None
+
+    def remove(self):
+        self.m.remove_overlay(self.overlay_id)
+
+
 class FileOverlay:
     def __init__(self, m, overlay_id, filename=None, size=None, stride=None, pos=(0,0)):
         self.m = m
@@ -826,6 +1071,98 @@ class FileOverlay:
         self.m.remove_overlay(self.overlay_id)
 
 
+class PreparedCommand:
+    """An mpv command whose node argument array is built once and reused. Arguments given as ``...`` in the
+    template are filled in on each call, all others are converted once. Calling it costs a string conversion per
+    changing argument instead of the list, node array and node list ``MPV.command`` builds on every call. Use
+    ``MPV.prepare_command`` to create one::
+
+        show_text = player.prepare_command('show-text', ..., 2000)
+        show_text('Person ahead')
+    """
+
+    def __init__(self, m, name, *args):
+        self.m = m
+        template = [name, *args]
+        self._slots = [i for i, arg in enumerate(template) if arg is Ellipsis]
+        # Keeps the argument strings alive while libmpv points at them
+        self._strings = [None if arg is Ellipsis else _mpv_coax_proptype(arg, str) for arg in template]
+        self._values = (MpvNode * len(template))(*[
+            MpvNode(format=MpvFormat.STRING, val=MpvNodeUnion(string=string)) for string in self._strings])
+        self._unions = [self._values[i].val for i in range(len(template))]
+        self._list = MpvNodeList(num=len(template), keys=None, values=self._values)
+        self._node = MpvNode(format=MpvFormat.NODE_ARRAY, val=MpvNodeUnion(list=pointer(self._list)))
+        self._pointer = pointer(self._node)
+        self._out = MpvNode()
+        self._lock = threading.Lock()
+
+    def _fill(self, args):
+        if len(args) != len(self._slots):
+            raise TypeError(f'Prepared command takes {len(self._slots)} arguments, {len(args)} given')
+        for i, arg in zip(self._slots, args):
+            self._strings[i] = string = _mpv_coax_proptype(arg, str)
+            self._unions[i].string = string
+
+    def __call__(self, *args, decoder=strict_decoder):
+        """Run the command with the given arguments and return its result, like ``MPV.command``."""
+        with self._lock:
+            self._fill(args)
+            _mpv_command_node(self.m.handle, self._pointer, byref(self._out))
+            rv = self._out.node_value(decoder=decoder)
+            _mpv_free_node_contents(byref(self._out))
+        return rv
+
+    def call_async(self, *args, callback=None, decoder=lazy_decoder):
+        """Run the command asynchronously, like ``MPV.command_async``."""
+        with self._lock:
+            self._fill(args)
+            # libmpv copies the arguments before this returns, so the arrays can be refilled straight away
+            return self.m._command_node_async(self._pointer, callback, decoder)
+
+
+class _PropertyGroupObserver:
+    """Collects the changes of a group of observed properties on the event thread and hands them to the handler as
+    one dict per interval, from its own thread."""
+
+    def __init__(self, m, names, handler, interval):
+        self.m = m
+        self.names = names
+        self.handler = handler
+        self.interval = interval
+        self.pending = {}
+        self.cond = threading.Condition()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._flush_loop, name='MPVPropertyGroup', daemon=True)
+        self.thread.start()
+
+    # Property observer, runs on the event thread
+    def __call__(self, name, value):
+        with self.cond:
+            if not self.pending:
+                self.cond.notify()
+            self.pending[name] = value
+
+    def _flush_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.stopped.is_set():
+                    self.cond.wait()
+            # Let the rest of this interval's changes arrive
+            if self.stopped.wait(self.interval):
+                return
+            with self.cond:
+                changes, self.pending = self.pending, {}
+            with self.m._enqueue_exceptions():
+                self.handler(changes)
+
+    def unobserve(self):
+        for name in self.names:
+            self.m.unobserve_property(name, self)
+        self.stopped.set()
+        with self.cond:
+            self.cond.notify()
+
+
 class MPV(object):
     """See man mpv(1) for the details of the implemented commands. All mpv properties can be accessed as
     ``my_mpv.some_property`` and all mpv options can be accessed as ``my_mpv['some-option']``.
@@ -867,11 +1204,17 @@ class MPV(object):
         self.raw    = _DecoderPropertyProxy(self, identity_decoder)
         self.strict = _DecoderPropertyProxy(self, strict_decoder)
         self.lazy   = _DecoderPropertyProxy(self, lazy_decoder)
+        self.cached = _CachedPropertyProxy(self)
 
-        self._event_callbacks = []
+        # Both are copy-on-write: they are replaced under _event_handler_lock, never modified in place, so the event
+        # thread can walk them without taking the lock
+        self._event_callbacks = ()
+        self._event_dispatch = {}
         self._command_reply_callbacks = {}
         self._event_handler_lock = threading.Lock()
         self._property_handlers = collections.defaultdict(lambda: [])
+        self._property_cache = {}
+        self._property_cache_observers = {}
         self._quit_handlers = set()
         self._message_handlers = {}
         self._key_binding_handlers = {}
@@ -913,14 +1256,19 @@ class MPV(object):
             try:
                 eid = event.event_id.value
 
-                with self._event_handler_lock:
-                    if eid == MpvEventID.SHUTDOWN:
+                if eid == MpvEventID.SHUTDOWN:
+                    with self._event_handler_lock:
                         self._core_shutdown = True
+                        self._property_cache.clear()
 
                 for callback in self._event_callbacks:
                     with self._enqueue_exceptions():
                         callback(event)
 
+                for callback in self._event_dispatch.get(eid, ()):
+                    with self._enqueue_exceptions():
+                        callback(event)
+
                 if eid == MpvEventID.PROPERTY_CHANGE:
                     pc = event.data
                     name, value, _fmt = pc.name, pc.value, pc.format
@@ -1171,6 +1519,17 @@ class MPV(object):
                 print('mpv returned an error:', e)
         """
 
+        if kwargs:
+            if args:
+                raise ValueError('Can only call mpv commands either using positional or using named arguments, not a mix of both.')
+            kwargs['name'] = name
+            _1, _2, _3, pointer = _make_node_str_map(kwargs)
+        else:
+            _1, _2, _3, pointer = _make_node_str_list([name, *args])
+
+        return self._command_node_async(cast(pointer, POINTER(MpvNode)), callback, decoder)
+
+    def _command_node_async(self, ppointer, callback, decoder):
         future = Future()
         future.set_running_or_notify_cancel()
 
@@ -1192,24 +1551,20 @@ class MPV(object):
 
         def abort():
             _mpv_abort_async_command(self._event_handle, id(future))
-            del self._command_reply_callbacks[id(future)]
+            self._command_reply_callbacks.pop(id(future), None)
         future.cancel = abort
 
         self._command_reply_callbacks[id(future)] = wrapper
 
-        if kwargs:
-            if args:
-                raise ValueError('Can only call mpv commands either using positional or using named arguments, not a mix of both.')
-            kwargs['name'] = name
-            _1, _2, _3, pointer = _make_node_str_map(kwargs)
-        else:
-            _1, _2, _3, pointer = _make_node_str_list([name, *args])
-
-        ppointer = cast(pointer, POINTER(MpvNode))
         _mpv_command_node_async(self._event_handle, id(future), ppointer)
         return future
 
 
+    def prepare_command(self, name, *args):
+        """Prepare a frequently run command, see ``PreparedCommand``. Arguments given as ``...`` are filled in on each
+        call. Only positional arguments are supported."""
+        return PreparedCommand(self, name, *args)
+
     def node_command(self, name, *args, decoder=strict_decoder):
         self.command(name, *args, decoder=decoder)
 
@@ -1303,6 +1658,12 @@ class MPV(object):
         self.overlays[overlay_id] = overlay
         return overlay
 
+    def create_array_overlay(self, frame=None, pos=(0,0), size=None):
+        overlay_id = self.allocate_overlay_id()
+        overlay = ArrayOverlay(self, overlay_id, frame, pos, size)
+        self.overlays[overlay_id] = overlay
+        return overlay
+
     def remove_overlay(self, overlay_id):
         self.overlay_remove(overlay_id)
         self.free_overlay_id(overlay_id)
@@ -1547,6 +1908,65 @@ class MPV(object):
         if not self._property_handlers[name]:
             _mpv_unobserve_property(self._event_handle, hash(name)&0xffffffffffffffff)
 
+    def cache_property(self, *names):
+        """Serve reads of the named properties through ``mpv.cached`` from a local cache. The cache is kept up to date
+        by observing the properties, so reading e.g. ``mpv.cached.time_pos`` or ``mpv.cached.core_idle`` in a polling
+        loop costs a dict lookup instead of a libmpv round trip. Until mpv has pushed a property's first value, and for
+        properties that aren't cached, ``mpv.cached`` reads the property like normal attribute access does::
+
+            player.cache_property('time-pos', 'core-idle')
+            while not player.cached.core_idle:
+                print(player.cached.time_pos)
+        """
+        for name in names:
+            name = _py_to_mpv(name)
+            if name in self._property_cache_observers:
+                continue
+            def update(name, value):
+                self._property_cache[name] = value
+            self._property_cache_observers[name] = update
+            self.observe_property(name, update)
+
+    def uncache_property(self, *names):
+        """Stop caching the named properties, see ``cache_property``."""
+        for name in names:
+            name = _py_to_mpv(name)
+            update = self._property_cache_observers.pop(name, None)
+            if update is not None:
+                self.unobserve_property(name, update)
+            self._property_cache.pop(name, None)
+
+    def _get_cached_property(self, name):
+        try:
+            return self._property_cache[name]
+        except KeyError:
+            return self._get_property(name, lazy_decoder)
+
+    def observe_properties(self, names, handler, interval=1/60):
+        """Register one observer on a group of properties. Changes arriving within ``interval`` seconds of each other
+        are coalesced and ``handler`` is called once with a dict of the changed properties and their latest values,
+        ``fun(changes)``. The handler runs on a thread of its own instead of the event thread. Returns a function that
+        unregisters the observer::
+
+            def update_display(changes):
+                print(changes)  # e.g. {'time-pos': 12.3, 'volume': 80.0}
+
+            unobserve = player.observe_properties(['time-pos', 'duration', 'volume', 'pause'], update_display)
+        """
+        names = [_py_to_mpv(name) for name in names]
+        group = _PropertyGroupObserver(self, names, handler, interval)
+        for name in names:
+            self.observe_property(name, group)
+        return group.unobserve
+
+    def properties_observer(self, *names, interval=1/60):
+        """Function decorator to register a grouped property observer. See ``MPV.observe_properties`` for
+        details."""
+        def wrapper(fun):
+            fun.unobserve_mpv_properties = self.observe_properties(names, fun, interval)
+            return fun
+        return wrapper
+
     def unobserve_all_properties(self, handler):
         """Unregister a property observer from *all* observed properties."""
         for name in self._property_handlers:
@@ -1617,17 +2037,33 @@ class MPV(object):
 
             my_handler.unregister_mpv_events()
         """
-        self._event_callbacks.append(callback)
+        with self._event_handler_lock:
+            self._event_callbacks = self._event_callbacks + (callback,)
 
     def unregister_event_callback(self, callback):
         """Unregiser an event callback."""
-        self._event_callbacks.remove(callback)
+        with self._event_handler_lock:
+            found = callback in self._event_callbacks
+            self._event_callbacks = tuple(cb for cb in self._event_callbacks if cb is not callback)
+            dispatch = {}
+            for eid, callbacks in self._event_dispatch.items():
+                if callback in callbacks:
+                    found = True
+                    callbacks = tuple(cb for cb in callbacks if cb is not callback)
+                if callbacks:
+                    dispatch[eid] = callbacks
+            self._event_dispatch = dispatch
+        if not found:
+            raise ValueError('callback is not registered')
 
     def event_callback(self, *event_types):
         """Function decorator to register a blanket event callback for the given event types. Event types can be given
         as str (e.g.  'start-file'), integer or MpvEventID object.
 
-        WARNING: Due to the way this is filtering events, this decorator cannot be chained with itself.
+        The callback is only called for events of the given types, it costs nothing on the event thread for any other
+        event.
+
+        WARNING: This decorator cannot be chained with itself.
 
         To unregister the event callback, call its ``unregister_mpv_events`` function::
 
@@ -1642,11 +2078,14 @@ class MPV(object):
             with self._event_handler_lock:
                 self.check_core_alive()
                 types = [MpvEventID.from_str(t) if isinstance(t, str) else t for t in event_types] or MpvEventID.ANY
+                types = {t.value if isinstance(t, MpvEventID) else t for t in types}
                 @wraps(callback)
                 def wrapper(event, *args, **kwargs):
-                    if event.event_id.value in types:
-                        callback(event, *args, **kwargs)
-                self._event_callbacks.append(wrapper)
+                    callback(event, *args, **kwargs)
+                dispatch = dict(self._event_dispatch)
+                for eid in types:
+                    dispatch[eid] = dispatch.get(eid, ()) + (wrapper,)
+                self._event_dispatch = dispatch
                 wrapper.unregister_mpv_events = partial(self.unregister_event_callback, wrapper)
                 return wrapper
         return register
@@ -1783,6 +2222,10 @@ class MPV(object):
                     return read # non-empty bytes object with input
                     return b'' # empty byte object signals permanent EOF
 
+                def readinto(self, buf): # optional, used instead of read() if present
+                    ...
+                    return n # number of bytes written into the writable memoryview buf, 0 signals EOF
+
                 def seek(self, pos): # optional
                     return new_offset # integer with new byte offset. The new offset may be before the requested offset
                     in case an exact seek is inconvenient.
@@ -1819,12 +2262,20 @@ class MPV(object):
 
                 cb_info.contents.cookie = None
 
+                readinto = getattr(frontend, 'readinto', None)
+
                 def read_backend(_userdata, buf, bufsize):
                     with self._enqueue_exceptions():
+                        if readinto is not None:
+                            # Let the frontend write straight into libmpv's buffer
+                            return readinto(memoryview((c_ubyte * bufsize).from_address(addressof(buf.contents))).cast('B'))
                         data = frontend.read(bufsize)
-                        for i in range(len(data)):
-                            buf[i] = data[i]
-                        return len(data)
+                        size = len(data)
+                        if size > bufsize:
+                            raise ValueError(f'Stream read() returned {size} bytes, more than the {bufsize} requested')
+                        # Copy the whole chunk into libmpv's buffer in one go
+                        memmove(buf, data if isinstance(data, bytes) else bytes(data), size)
+                        return size
                     return -1
                 read = cb_info.contents.read = StreamReadFn(read_backend)
 
@@ -1905,7 +2356,7 @@ class MPV(object):
             else:
                 raise ValueError('Python stream name not found and no catch-all defined')
 
-        return GeneratorStream(generator_fun, size)
+        return ChunkStream(generator_fun, size)
 
     def python_stream(self, name=None, size=None):
         """Register a generator for the python stream with the given name.
@@ -1944,6 +2395,28 @@ class MPV(object):
             return cb
         return register
 
+    def python_stream_source(self, name, source, size=None):
+        """Register a file-like object (with ``readinto``) or a bytes-like object such as an ``mmap.mmap`` as the
+        python stream with the given name. libmpv reads it in place, without intermediate copies. Returns a function
+        that unregisters the stream.
+
+        with open('cached.mp3', 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            unregister = mpv.python_stream_source('cached', data)
+            mpv.play('python://cached')
+            mpv.wait_for_playback()
+            unregister()
+        """
+        if callable(source):
+            raise TypeError('Use python_stream for generator functions')
+        if name in self._python_streams:
+            raise KeyError('Python stream name "{}" is already registered'.format(name))
+        self._python_streams[name] = (source, size)
+        def unregister():
+            if name not in self._python_streams or self._python_streams[name][0] is not source:
+                raise RuntimeError('Python stream has already been unregistered')
+            del self._python_streams[name]
+        return unregister
+
     def python_stream_catchall(self, cb):
         """ Register a catch-all python stream to be called when no name matches can be found. Use this decorator on a
         function that takes a name argument and returns a (generator, size) tuple (with size being None if unknown).
@@ -1983,23 +2456,50 @@ class MPV(object):
     # Property accessors
     def _get_property(self, name, decoder=strict_decoder, fmt=MpvFormat.NODE):
         self.check_core_alive()
-        out = create_string_buffer(sizeof(MpvNode))
         try:
-            cval = _mpv_get_property(self.handle, name.encode('utf-8'), fmt, out)
-
             if fmt is MpvFormat.OSD_STRING:
+                out = create_string_buffer(sizeof(MpvNode))
+                cval = _mpv_get_property(self.handle, name.encode('utf-8'), fmt, out)
                 return cast(out, POINTER(c_char_p)).contents.value.decode('utf-8')
             elif fmt is MpvFormat.NODE:
-                rv = cast(out, POINTER(MpvNode)).contents.node_value(decoder=decoder)
-                _mpv_free_node_contents(out)
+                out = MpvNode()
+                cval = _mpv_get_property(self.handle, name.encode('utf-8'), fmt, byref(out))
+                rv = out.node_value(decoder=decoder)
+                _mpv_free_node_contents(byref(out))
                 return rv
             else:
                 raise TypeError('_get_property only supports NODE and OSD_STRING formats.')
         except PropertyUnavailableError as ex:
             return None
 
+    def get_properties(self, *names, decoder=lazy_decoder):
+        """Read several properties in one pass and return them as a dict, ``{name: value}``. Values are decoded and
+        unavailable properties are None, like for attribute access. This saves the per property overhead of attribute access (the core check,
+        a new node buffer and the proxy lookup)::
+
+            state = player.get_properties('duration', 'time-pos', 'volume', 'pause')
+        """
+        self.check_core_alive()
+        out = MpvNode()
+        pout = byref(out)
+        values = {}
+        for name in names:
+            name = _py_to_mpv(name)
+            try:
+                _mpv_get_property(self.handle, name.encode('utf-8'), MpvFormat.NODE, pout)
+            except PropertyUnavailableError:
+                values[name] = None
+                continue
+            try:
+                values[name] = out.node_value(decoder=decoder)
+            finally:
+                _mpv_free_node_contents(pout)
+        return values
+
     def _set_property(self, name, value):
         self.check_core_alive()
+        # A cached value is stale until mpv pushes the new one
+        self._property_cache.pop(name, None)
         ename = name.encode('utf-8')
         if isinstance(value, (list, set, dict)):
             _1, _2, _3, pointer = _make_node_str_list(value)
@@ -2099,3 +2599,133 @@ class MpvRenderContext:
     def report_swap(self):
         _mpv_render_context_report_swap(self._handle)
 
+
+class AsyncMPV:
+    """asyncio facade for an MPV instance. Commands, property waits and event streams are awaitable or async
+    iterable. Results are handed from the MPV event thread to the asyncio loop with ``loop.call_soon_threadsafe``, so
+    no thread is started or blocked per wait. Cancelling an awaiting task aborts the command or removes the waiter.
+    Anything else (properties, synchronous methods) is passed through to the wrapped MPV instance::
+
+        player = AsyncMPV(ytdl=False)
+        await player.command('loadfile', 'speech.mp3')
+        await player.wait_for_property('idle-active')
+        async for event in player.events('end-file'):
+            print(event)
+    """
+
+    def __init__(self, *extra_mpv_flags, mpv=None, **extra_mpv_opts):
+        self.mpv = mpv if mpv is not None else MPV(*extra_mpv_flags, **extra_mpv_opts)
+
+    def __getattr__(self, name):
+        return getattr(self.mpv, name)
+
+    def __setattr__(self, name, value):
+        if name == 'mpv':
+            super().__setattr__(name, value)
+        else:
+            setattr(self.mpv, name, value)
+
+    @staticmethod
+    def _resolve(future, result=None, exception=None):
+        # Runs on the asyncio loop, the future may have been cancelled or resolved in the meantime
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    async def command(self, name, *args, decoder=lazy_decoder, **kwargs):
+        """Run an mpv command without blocking the loop and return its result."""
+        return await asyncio.wrap_future(self.mpv.command_async(name, *args, decoder=decoder, **kwargs))
+
+    async def _wait(self, future, register):
+        # register(resolve) installs the thread side handlers and returns a function removing them again
+        loop = asyncio.get_running_loop()
+        def resolve(result=None, exception=None):
+            loop.call_soon_threadsafe(self._resolve, future, result, exception)
+
+        @self.mpv.event_callback('shutdown')
+        def shutdown_handler(event):
+            resolve(exception=ShutdownError('libmpv core has been shutdown'))
+        unregister = register(resolve)
+        try:
+            self.mpv.check_core_alive()
+            return await future
+        finally:
+            unregister()
+            shutdown_handler.unregister_mpv_events()
+
+    async def wait_for_property(self, name, cond=lambda val: val, level_sensitive=True):
+        """Wait until ``cond`` is truthy for the named property and return its result, like MPV.wait_for_property.
+        ``cond`` runs on the event thread."""
+        future = asyncio.get_running_loop().create_future()
+        def register(resolve):
+            def observer(_name, val):
+                try:
+                    rv = cond(val)
+                    if rv:
+                        resolve(rv)
+                except Exception as e:
+                    resolve(exception=e)
+            self.mpv.observe_property(name, observer)
+            if level_sensitive:
+                try:
+                    rv = cond(getattr(self.mpv, name.replace('-', '_')))
+                    if rv:
+                        self._resolve(future, rv)
+                except Exception as e:
+                    self._resolve(future, exception=e)
+            return partial(self.mpv.unobserve_property, name, observer)
+        return await self._wait(future, register)
+
+    async def wait_for_event(self, *event_types, cond=lambda evt: True):
+        """Wait for the indicated event(s), like MPV.wait_for_event. ``cond`` runs on the event thread."""
+        future = asyncio.get_running_loop().create_future()
+        def register(resolve):
+            @self.mpv.event_callback(*event_types)
+            def handler(event):
+                try:
+                    rv = cond(event)
+                    if rv:
+                        resolve(rv)
+                except Exception as e:
+                    resolve(exception=e)
+            return handler.unregister_mpv_events
+        return await self._wait(future, register)
+
+    async def wait_for_playback(self):
+        """Wait until playback of the current title is finished."""
+        await self.wait_for_event('end-file')
+
+    async def wait_for_shutdown(self):
+        """Wait for the core to shut down."""
+        # Nothing but _wait's own shutdown handler resolves the future
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await self._wait(future, lambda resolve: (lambda: None))
+        except ShutdownError:
+            return
+
+    async def events(self, *event_types, decoder=lazy_decoder):
+        """Async iterator over events of the given types (all types if none are given), as dicts like
+        MpvEvent.as_dict. Ends when the core shuts down."""
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        types = [MpvEventID.from_str(t) if isinstance(t, str) else t for t in event_types] or MpvEventID.ANY
+        types = {t.value if isinstance(t, MpvEventID) else t for t in types}
+
+        # The event structure is only valid during the callback, so it is converted on the event thread
+        @self.mpv.event_callback(*types, MpvEventID.SHUTDOWN)
+        def handler(event):
+            eid = event.event_id.value
+            loop.call_soon_threadsafe(events.put_nowait, (eid, event.as_dict(decoder) if eid in types else None))
+        try:
+            while True:
+                eid, event = await events.get()
+                if event is not None:
+                    yield event
+                if eid == MpvEventID.SHUTDOWN:
+                    return
+        finally:
+            handler.unregister_mpv_events()
@@ -0,0 +1,153 @@
+import time
+import logging
+import threading
+import cv2
+import numpy as np
+
+### This is obstacle.py ###
+# On-device looming detector. Runs next to the cloud narration and gives an instant audio cue when
+# something in the path ahead is getting bigger fast, without waiting for the vision model.
+# Dense optical flow on a tiny grayscale frame is cheap enough for a Pi Zero 2, and the frame budget
+# adapts the analysis size so a slow frame never starves the rest of VisGuide.
+
+logger = logging.getLogger()
+
+FRAME_BUDGET = 0.2       # Seconds per analysed frame (5 fps)
+TTC_THRESHOLD = 1.5      # Alert when the estimated time to contact drops below this (seconds)
+CONFIRM_FRAMES = 2       # Consecutive looming frames needed before alerting
+COOLDOWN = 2.0           # Min seconds between two audio cues
+MIN_WIDTH = 40           # Smallest analysis width the budget can shrink to
+MAX_WIDTH = 96           # Largest analysis width the budget can grow to
+ADAPT_FRAMES = 5         # Consecutive slow (or fast) analysed frames needed before changing the width
+
+
+# FUNC: Generate a short beep as 16 bit mono samples for simpleaudio.play_buffer
+def make_tone(frequency=880, duration=0.12, sample_rate=22050, volume=0.5):
+    t = np.linspace(0, duration, int(sample_rate * duration), False)
+    tone = np.sin(frequency * t * 2 * np.pi)
+    # Fade in and out over 10 ms to avoid clicks
+    fade = min(len(tone) // 2, int(sample_rate * 0.01))
+    if fade:
+        ramp = np.linspace(0, 1, fade)
+        tone[:fade] *= ramp
+        tone[-fade:] *= ramp[::-1]
+    return (tone * volume * 32767).astype(np.int16)
+
+
+class LoomingDetector:
+    """Estimates time to contact for whatever is straight ahead from consecutive frames."""
+
+    def __init__(self, width=64, ttc_threshold=TTC_THRESHOLD, confirm_frames=CONFIRM_FRAMES):
+        self.width = width
+        self.ttc_threshold = ttc_threshold
+        self.confirm_frames = confirm_frames
+        self._prev = None
+        self._prev_time = None
+        self._hits = 0
+        # Whether the last update compared two frames, the first frame after a reset only prepares one
+        self.compared = False
+
+    def reset(self):
+        self._prev = None
+        self._hits = 0
+
+    def _prepare(self, frame):
+        h, w = frame.shape[:2]
+        height = max(1, int(h * self.width / float(w)))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    # Returns the estimated time to contact in seconds, or None when nothing is approaching
+    def update(self, frame, now=None):
+        now = time.time() if now is None else now
+        gray = self._prepare(frame)
+        prev, prev_time = self._prev, self._prev_time
+        self._prev, self._prev_time = gray, now
+        self.compared = False
+        if prev is None or prev.shape != gray.shape or now <= prev_time:
+            return None
+
+        self.compared = True
+        flow = cv2.calcOpticalFlowFarneback(prev, gray, None, 0.5, 2, 9, 2, 5, 1.1, 0)
+        divergence = np.gradient(flow[..., 0], axis=1) + np.gradient(flow[..., 1], axis=0)
+
+        # Centre of the path ahead vs the periphery, so walking forward (which expands everything) is ignored
+        h, w = divergence.shape
+        centre = divergence[h // 4:, w // 3:2 * w // 3]
+        mask = np.ones_like(divergence, dtype=bool)
+        mask[h // 4:, w // 3:2 * w // 3] = False
+        expansion = (centre.mean() - divergence[mask].mean()) / (now - prev_time)
+        if expansion <= 0:
+            return None
+        # For a surface approaching the camera divergence = 2 / time to contact
+        return 2.0 / expansion
+
+    # Returns True when the looming has been confirmed over enough frames
+    def is_hazard(self, ttc):
+        if ttc is not None and ttc < self.ttc_threshold:
+            self._hits += 1
+        else:
+            self._hits = 0
+        return self._hits >= self.confirm_frames
+
+
+class HazardMonitor(threading.Thread):
+    """Background thread that reads frames under a fixed budget and calls on_hazard for approaching obstacles."""
+
+    def __init__(self, read_frame, on_hazard, frame_budget=FRAME_BUDGET, cooldown=COOLDOWN):
+        super().__init__(daemon=True)
+        self.read_frame = read_frame
+        self.on_hazard = on_hazard
+        self.frame_budget = frame_budget
+        self.cooldown = cooldown
+        self.detector = LoomingDetector()
+        self.stop_event = threading.Event()
+        self.last_alert = 0
+        self.overruns = 0
+        self.slow_frames = 0
+        self.fast_frames = 0
+
+    def stop(self):
+        self.stop_event.set()
+
+    # Keep the analysis inside the budget: shrink when slow, grow back when there's headroom. Only frames
+    # that ran the optical flow count, and the width only changes after ADAPT_FRAMES of them in a row, since
+    # every change resets the detector and costs it a frame and its confirmation count
+    def _adapt(self, work):
+        self.slow_frames = self.slow_frames + 1 if work > self.frame_budget * 0.6 else 0
+        self.fast_frames = self.fast_frames + 1 if work < self.frame_budget * 0.25 else 0
+        width = self.detector.width
+        if self.slow_frames >= ADAPT_FRAMES and width > MIN_WIDTH:
+            width = max(MIN_WIDTH, width * 3 // 4)
+        elif self.fast_frames >= ADAPT_FRAMES and width < MAX_WIDTH:
+            width = min(MAX_WIDTH, width + 8)
+        if width != self.detector.width:
+            logger.debug(f"Hazard monitor analysis width {self.detector.width} -> {width}")
+            self.detector.width = width
+            self.detector.reset()
+            self.slow_frames = self.fast_frames = 0
+
+    def run(self):
+        logger.debug("TIMING:Start TYPE:Thread DESC:HazardMonitor RESULT:None")
+        while not self.stop_event.is_set():
+            start = time.time()
+            frame = self.read_frame()
+            if frame is not None:
+                # Only the detector's own work is measured, not the wait for the camera
+                now = time.time()
+                try:
+                    ttc = self.detector.update(frame, now)
+                    work = time.time() - now
+                    if self.detector.is_hazard(ttc) and now - self.last_alert >= self.cooldown:
+                        self.last_alert = now
+                        logger.info(f"Hazard ahead, time to contact {ttc:.1f} seconds")
+                        self.on_hazard(ttc)
+                    if self.detector.compared:
+                        self._adapt(work)
+                except Exception as e:
+                    logger.error(f"Error in hazard monitor: {e}")
+            elapsed = time.time() - start
+            if elapsed > self.frame_budget:
+                self.overruns += 1
+            self.stop_event.wait(max(0, self.frame_budget - elapsed))
+        logger.debug(f"TIMING:End TYPE:Thread DESC:HazardMonitor RESULT:{self.overruns} budget overruns")
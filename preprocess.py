@@ -0,0 +1,128 @@
+import base64
+import cv2
+import numpy as np
+from PIL import Image
+
+### This is preprocess.py ###
+# Image preprocessing shared by visguide.py and the helper scripts.
+# Nothing in here touches the camera, the network or the audio device so it can be imported anywhere.
+
+# Upload modes
+ROI_OFF = "off"          # Uniformly resized full frame (original behaviour)
+ROI_CROP = "crop"        # Tighter crop around the walking path only
+ROI_CONTEXT = "context"  # Tighter crop plus a low resolution thumbnail of the whole scene
+ROI_MODES = (ROI_OFF, ROI_CROP, ROI_CONTEXT)
+
+MAX_SIZE = 250           # Longest side of the main uploaded image
+CROP_SIZE = 200          # Longest side of the region of interest crop, still more detail per metre than the full frame
+THUMBNAIL_SIZE = 96      # Longest side of the context thumbnail
+ANALYSIS_WIDTH = 160     # Width the saliency analysis runs at, keeps it cheap on the Pi Zero
+
+
+# FUNC: Resize a BGR frame so its longest side is max_size (same LANCZOS path the capture always used)
+def resize_max(frame, max_size=MAX_SIZE):
+    pil_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    ratio = max_size / max(pil_img.size)
+    new_size = tuple([max(1, int(x*ratio)) for x in pil_img.size])
+    resized_img = pil_img.resize(new_size, Image.LANCZOS)
+    return cv2.cvtColor(np.array(resized_img), cv2.COLOR_RGB2BGR)
+
+
+# FUNC: Encode a BGR frame as JPEG and return (jpeg bytes, base64 string)
+def encode_jpeg(frame, quality=95):
+    frame_jpg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+    return frame_jpg, base64.b64encode(frame_jpg).decode("utf-8")
+
+
+# FUNC: Estimate the horizon row of a small grayscale image
+# The horizon is taken as the strongest change in mean row brightness (sky/ceiling vs ground)
+# and is clamped to the middle of the frame so a bright floor or dark sky can't push it to an edge.
+def estimate_horizon(gray):
+    h = gray.shape[0]
+    rows = cv2.GaussianBlur(gray, (5, 5), 0).mean(axis=1)
+    change = np.abs(np.diff(rows))
+    low, high = int(h * 0.2), int(h * 0.7)
+    if high <= low + 1:
+        return h // 2
+    return low + int(np.argmax(change[low:high]))
+
+
+# FUNC: Find the most informative region ahead of the user
+# Returns (x, y, w, h) in full frame coordinates.
+# Scores fixed size windows by edge density (from an integral image so each window costs four lookups),
+# weighted towards the horizontal centre and towards the ground in front of the user, below the horizon.
+def find_region_of_interest(frame, crop_fraction=0.6, analysis_width=ANALYSIS_WIDTH, steps=5):
+    full_h, full_w = frame.shape[:2]
+    scale = analysis_width / float(full_w)
+    small = cv2.resize(frame, (analysis_width, max(1, int(full_h * scale))), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape
+
+    edges = cv2.Canny(gray, 50, 150)
+    integral = cv2.integral(edges // 255)
+    horizon = estimate_horizon(gray)
+
+    win_w, win_h = max(1, int(w * crop_fraction)), max(1, int(h * crop_fraction))
+    best_score, best = -1.0, (0, 0)
+    for y in np.linspace(0, h - win_h, steps).astype(int):
+        for x in np.linspace(0, w - win_w, steps).astype(int):
+            edge_count = (integral[y + win_h, x + win_w] - integral[y, x + win_w]
+                          - integral[y + win_h, x] + integral[y, x])
+            density = edge_count / float(win_w * win_h)
+            # Prefer the path straight ahead
+            centre_offset = abs((x + win_w / 2.0) - w / 2.0) / (w / 2.0)
+            # Prefer windows that cover the ground between the horizon and the user's feet
+            below = (y + win_h - max(y, horizon)) / float(win_h)
+            score = density * (1.0 - 0.5 * centre_offset) * (0.5 + 0.5 * max(0.0, below))
+            if score > best_score:
+                best_score, best = score, (x, y)
+
+    x, y = best
+    return (int(x / scale), int(y / scale), min(full_w, int(win_w / scale)), min(full_h, int(win_h / scale)))
+
+
+# FUNC: Prepare the images to upload for a captured frame
+# Returns a list of (jpeg bytes, base64 string) pairs; the first is always the main image.
+def prepare_upload(frame, roi_mode=ROI_OFF):
+    if roi_mode not in ROI_MODES:
+        raise ValueError(f"Unknown ROI mode: {roi_mode}")
+    if roi_mode == ROI_OFF:
+        main_img = resize_max(frame)
+    else:
+        x, y, w, h = find_region_of_interest(frame)
+        # Never upscale a small crop, that only adds bytes
+        main_img = resize_max(frame[y:y + h, x:x + w], min(CROP_SIZE, max(w, h)))
+    images = [encode_jpeg(main_img)]
+    if roi_mode == ROI_CONTEXT:
+        images.append(encode_jpeg(resize_max(frame, THUMBNAIL_SIZE), quality=70))
+    return images
+
+
+# FUNC: Decode a base64 JPEG (as uploaded) back to a BGR frame, None if it isn't a readable image
+def decode_jpeg(base64_image):
+    data = np.frombuffer(base64.b64decode(base64_image), dtype=np.uint8)
+    return cv2.imdecode(data, cv2.IMREAD_COLOR) if data.size else None
+
+
+# FUNC: Difference hash of a frame as a 64 bit int (for size=8)
+# Each bit says whether a pixel of the size x (size+1) grayscale thumbnail is brighter than its right
+# neighbour, so re-encoding, small exposure changes and resizing barely change the hash.
+def dhash(frame, size=8):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+# FUNC: Small blurred grayscale thumbnail used for change detection
+def change_thumbnail(frame, width=64):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    height = max(1, int(gray.shape[0] * width / gray.shape[1]))
+    return cv2.GaussianBlur(cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA), (3, 3), 0)
+
+
+# FUNC: How much the scene changed between two change thumbnails, 0 (same) to 1, 1 if there is no previous one
+def change_score(previous, current):
+    if previous is None or previous.shape != current.shape:
+        return 1.0
+    return float(cv2.absdiff(previous, current).mean()) / 255.0
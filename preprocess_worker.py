@@ -0,0 +1,116 @@
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import preprocess
+
+### This is preprocess_worker.py ###
+# Runs the CPU heavy part of a capture (resize, colour conversion, JPEG encoding, perceptual hash and
+# change detection) in a separate process. On the Pi this work holds the GIL for tens of milliseconds
+# on the main process and starves the button and audio threads, which is heard as stutter.
+# The raw frame is copied into shared memory (no pickling of a megabyte array) and only the small
+# JPEGs come back through a pipe, while the calling thread waits without holding the GIL.
+# InlinePreprocessor does the same work in process, they are interchangeable.
+
+logger = logging.getLogger()
+
+MAX_FRAME_BYTES = 1920 * 1080 * 3
+
+
+# FUNC: Everything a capture needs from a frame, returns (result, change thumbnail for next time)
+def process_frame(frame, roi_mode, previous=None, keep_full=False):
+    thumbnail = preprocess.change_thumbnail(frame)
+    result = {
+        "images": preprocess.prepare_upload(frame, roi_mode),
+        "scene_hash": preprocess.dhash(frame),
+        "change": preprocess.change_score(previous, thumbnail),
+        # The full frame, for the session recording
+        "full_jpeg": preprocess.encode_jpeg(frame, 90)[0] if keep_full else None,
+    }
+    return result, thumbnail
+
+
+class InlinePreprocessor:
+    """Preprocesses on the calling thread."""
+
+    def __init__(self):
+        self.previous = None
+
+    def process(self, frame, roi_mode, keep_full=False):
+        result, self.previous = process_frame(frame, roi_mode, self.previous, keep_full)
+        return result
+
+    def close(self):
+        pass
+
+
+def _worker_main(conn, shm_name):
+    # Forked, so this shares the parent's resource tracker and the parent unlinks the memory
+    shm = shared_memory.SharedMemory(name=shm_name)
+    previous = None
+    try:
+        while True:
+            job = conn.recv()
+            if job is None:
+                break
+            shape, roi_mode, keep_full = job
+            try:
+                frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf).copy()
+                result, previous = process_frame(frame, roi_mode, previous, keep_full)
+                conn.send(("ok", result))
+            except Exception as e:
+                conn.send(("error", str(e)))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        shm.close()
+
+
+class PreprocessWorker:
+    """Preprocesses in a child process fed through shared memory. Falls back to preprocessing inline
+    if the worker dies or doesn't answer within timeout seconds.
+
+    Start it before other threads are running (it forks) and before the camera is opened.
+    """
+
+    def __init__(self, max_frame_bytes=MAX_FRAME_BYTES, timeout=5.0):
+        self.timeout = timeout
+        self.max_frame_bytes = max_frame_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max_frame_bytes)
+        self.conn, child_conn = multiprocessing.Pipe()
+        # fork: spawn would re-run visguide.py's module level code (camera, buttons...) in the child
+        self.worker = multiprocessing.get_context("fork").Process(
+            target=_worker_main, args=(child_conn, self.shm.name), name="preprocess", daemon=True)
+        self.worker.start()
+        child_conn.close()
+        self.fallback = None
+
+    def process(self, frame, roi_mode, keep_full=False):
+        if self.fallback is None and frame.dtype == np.uint8 and frame.nbytes <= self.max_frame_bytes:
+            try:
+                np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf)[...] = frame
+                self.conn.send((frame.shape, roi_mode, keep_full))
+                if not self.conn.poll(self.timeout):
+                    raise TimeoutError(f"no answer in {self.timeout} seconds")
+                status, result = self.conn.recv()
+                if status == "ok":
+                    return result
+                logger.error(f"Preprocess worker failed: {result}")
+            except (OSError, EOFError, TimeoutError) as e:
+                # The worker is gone or stuck, don't let capture depend on it again
+                logger.error(f"Preprocess worker lost ({e}), preprocessing inline from now on")
+                self.fallback = InlinePreprocessor()
+                self.worker.kill()
+        return (self.fallback or InlinePreprocessor()).process(frame, roi_mode, keep_full)
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.worker.join(1)
+        if self.worker.is_alive():
+            self.worker.kill()
+        self.conn.close()
+        self.shm.close()
+        self.shm.unlink()
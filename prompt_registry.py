@@ -0,0 +1,89 @@
+import re
+import logging
+
+### This is prompt_registry.py ###
+# Loads prompts.txt once, validates it and keeps each prompt with its whitespace compacted, so the file
+# is only parsed at startup and the prompts don't carry the line breaks and indentation of the file.
+
+logger = logging.getLogger()
+
+PROMPT_PREFIX = "PROMPT_"
+REQUIRED_PROMPTS = ("Guide", "Tourist")
+
+
+class PromptError(ValueError):
+    pass
+
+
+class PromptTemplate(str):
+    """The compacted prompt text plus its name, it is a str so it can be used anywhere a context string was."""
+
+    def __new__(cls, name, text):
+        template = super().__new__(cls, compact(text))
+        template.name = name
+        return template
+
+
+# FUNC: Collapse runs of whitespace and strip the surrounding quotes a shell style .txt/.env value carries
+def compact(text):
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'":
+        text = text[1:-1]
+    return re.sub(r"\s+", " ", text).strip()
+
+
+# FUNC: Parse KEY="value" lines into {name: PromptTemplate}, the PROMPT_ prefix is dropped from the name
+def parse_prompts(lines, source="prompts"):
+    prompts = {}
+    for number, line in enumerate(lines, 1):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        # Only split on the first equals sign, the prompts themselves can contain one
+        key, sep, value = line.partition("=")
+        key = key.strip()
+        if not sep or not key.startswith(PROMPT_PREFIX) or not key[len(PROMPT_PREFIX):].isidentifier():
+            raise PromptError(f"{source}:{number}: expected PROMPT_<Name>=\"<prompt>\"")
+        name = key[len(PROMPT_PREFIX):]
+        if name in prompts:
+            raise PromptError(f"{source}:{number}: {key} is defined twice")
+        template = PromptTemplate(name, value)
+        if not template:
+            raise PromptError(f"{source}:{number}: {key} is empty")
+        prompts[name] = template
+    return prompts
+
+
+class PromptRegistry:
+    """All the prompts, looked up by name with or without the PROMPT_ prefix."""
+
+    def __init__(self, prompts, required=REQUIRED_PROMPTS):
+        missing = [name for name in required if name not in prompts]
+        if missing:
+            raise PromptError(f"Missing prompts: {', '.join(PROMPT_PREFIX + name for name in missing)}")
+        self._prompts = dict(prompts)
+
+    def __getitem__(self, name):
+        if name.startswith(PROMPT_PREFIX):
+            name = name[len(PROMPT_PREFIX):]
+        return self._prompts[name]
+
+    def __contains__(self, name):
+        try:
+            self[name]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def names(self):
+        return list(self._prompts)
+
+
+# FUNC: Load and validate the prompts file
+def load_prompts(path, required=REQUIRED_PROMPTS):
+    with open(path) as f:
+        registry = PromptRegistry(parse_prompts(f, source=path), required)
+    logger.debug(f"Loaded prompts {registry.names()} from {path}")
+    return registry
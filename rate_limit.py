@@ -0,0 +1,68 @@
+import time
+import threading
+from collections import OrderedDict
+
+### This is rate_limit.py ###
+# Token bucket rate limiting, one bucket per device. Used by visguide_gateway.py so one chatty device
+# can't use up the shared upstream quota.
+
+
+class TokenBucket:
+    """Holds up to burst tokens and refills at rate tokens per second."""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Take tokens if there are enough. Returns 0 on success, otherwise the seconds until there will be
+    def take(self, tokens=1):
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (tokens - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """A token bucket per key (device). The least recently seen keys are forgotten past max_keys."""
+
+    def __init__(self, rate, burst, max_keys=1024, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Returns 0 if the key may go ahead, otherwise the seconds it should wait before trying again
+    def take(self, key, tokens=1):
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.rate, self.burst, self.clock)
+                while len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+            return bucket.take(tokens)
+
+    # Block until the key may go ahead, False if that would take longer than timeout seconds
+    def acquire(self, key, tokens=1, timeout=None):
+        give_up = None if timeout is None else self.clock() + timeout
+        while True:
+            wait = self.take(key, tokens)
+            if not wait:
+                return True
+            if give_up is not None and self.clock() + wait > give_up:
+                return False
+            time.sleep(wait)
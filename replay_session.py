@@ -0,0 +1,108 @@
+import os
+import time
+import argparse
+import logging
+import cv2
+import preprocess
+import session_recorder
+from bench_latency import summarise, print_table
+
+### This is replay_session.py ###
+# Feeds a session recorded with "visguide.py --record DIR" back through the pipeline for profiling.
+# Frames go through the same preprocessing as a live capture; with --analyze the requests are sent to
+# the vision model again and with --tts the responses are turned into audio again (nothing is played).
+# --speed 1 keeps the original timing, 4 replays four times faster and 0 as fast as possible.
+#   python replay_session.py recordings/monday --speed 0 --analyze
+
+logger = logging.getLogger()
+
+
+# FUNC: Build the vision router and prompts only when the replay needs them
+def make_router():
+    from openai import OpenAI
+    import prompt_registry
+    import vision_backends
+    client = OpenAI(base_url=os.environ.get('OPENAI_BASE_URL'))
+    router = vision_backends.BackendRouter([vision_backends.OpenAIVisionBackend(client)])
+    return router, prompt_registry.load_prompts('./prompts.txt')
+
+
+# FUNC: Generate (but don't play) the audio for a narration, returns (seconds to first chunk, bytes)
+def replay_tts(text):
+    from elevenlabs import Voice, VoiceSettings, set_api_key, generate
+    set_api_key(os.environ.get("ELEVENLABS_API_KEY"))
+    start = time.time()
+    first_chunk, tts_bytes = None, 0
+    for chunk in generate(
+        text=text,
+        voice=Voice(voice_id=os.environ.get("ELEVENLABS_VOICE_ID"),
+                    settings=VoiceSettings(stability=0.71, similarity_boost=0.5, style=0.0, use_speaker_boost=True)),
+        model="eleven_turbo_v2",
+        stream=True,
+        stream_chunk_size=4096,
+    ):
+        if first_chunk is None:
+            first_chunk = time.time() - start
+        tts_bytes += len(chunk)
+    return first_chunk or 0.0, tts_bytes
+
+
+def replay(directory, speed=1.0, analyze=False, tts=False):
+    events = session_recorder.read_session(directory)
+    if not events:
+        raise ValueError(f"No events recorded in {directory}")
+    recorded, replayed = {}, {}
+    router, prompts = make_router() if analyze else (None, None)
+    images, script = None, []
+    upload_bytes = {"recorded": 0, "replayed": 0}
+    t0, start = events[0]["t"], time.time()
+
+    for event in events:
+        # Keep the original spacing between events, scaled by the speed
+        if speed > 0:
+            delay = start + (event["t"] - t0) / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+        kind = event["kind"]
+        if kind == "stage":
+            recorded.setdefault(event["name"], []).append(event["seconds"])
+        elif kind == "tts":
+            recorded.setdefault("tts_first_chunk", []).append(event["first_chunk"])
+        elif kind == "frame":
+            path = os.path.join(directory, event["ref"])
+            frame = cv2.imread(path)
+            if frame is None:
+                raise ValueError(f"Could not read recorded frame {path}")
+            stage_start = time.time()
+            images = preprocess.prepare_upload(frame, event.get("roi_mode", preprocess.ROI_OFF))
+            replayed.setdefault("preprocess", []).append(time.time() - stage_start)
+            upload_bytes["recorded"] += event.get("upload_bytes", 0)
+            upload_bytes["replayed"] += sum(len(b64) for _, b64 in images)
+        elif kind == "request" and analyze and images is not None:
+            context = prompts.get(event.get("style") or "Guide", prompts["Guide"])
+            stage_start = time.time()
+            text = router.describe(context, script, [b64 for _, b64 in images])
+            replayed.setdefault("analyze", []).append(time.time() - stage_start)
+            script = script + [{"role": "assistant", "content": text}]
+        elif kind == "response" and tts:
+            first_chunk, _ = replay_tts(event["text"])
+            replayed.setdefault("tts_first_chunk", []).append(first_chunk)
+
+    print(f"Replayed {len(events)} events from {directory} in {time.time() - start:.1f} seconds")
+    print("Recorded:")
+    print_table(summarise(recorded))
+    print("Replayed:")
+    print_table(summarise(replayed))
+    print(f"Upload bytes recorded {upload_bytes['recorded']}, replayed {upload_bytes['replayed']}")
+    return recorded, replayed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded VisGuide session for profiling")
+    parser.add_argument("directory", help="Directory written by visguide.py --record")
+    parser.add_argument("-s", "--speed", type=float, default=1.0, help="1 is real time, 0 is as fast as possible")
+    parser.add_argument("--analyze", action="store_true", help="Send the requests to the vision model again")
+    parser.add_argument("--tts", action="store_true", help="Generate the narration audio again (not played)")
+    args = parser.parse_args()
+    replay(args.directory, args.speed, args.analyze, args.tts)
@@ -0,0 +1,110 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+
+### This is runtime_config.py ###
+# In-memory store for the settings VisGuide changes at runtime (mode, style, voice).
+# Button handlers only update memory and return; the .env file is rewritten later on a background
+# thread, debounced so a burst of presses is one write, and atomically (temp file plus rename) so a
+# power cut on the Pi never leaves a half written .env behind.
+
+logger = logging.getLogger()
+
+
+# FUNC: Replace (or add) the export KEY="value" lines of an env file, atomically
+def write_env_file(path, values):
+    lines = []
+    if os.path.exists(path):
+        with open(path) as f:
+            lines = f.readlines()
+    remaining = dict(values)
+    for i, line in enumerate(lines):
+        for key in list(remaining):
+            if line.strip().startswith(f"export {key}="):
+                lines[i] = f"export {key}=\"{remaining.pop(key)}\"\n"
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    lines += [f"export {key}=\"{value}\"\n" for key, value in remaining.items()]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".env.", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+class RuntimeConfig:
+    """Thread safe settings with change notification and debounced write-behind persistence."""
+
+    def __init__(self, values=None, path=".env", persist_keys=(), debounce=1.0):
+        self.path = path
+        self.persist_keys = set(persist_keys)
+        self.debounce = debounce
+        self._values = dict(values or {})
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._dirty = threading.Condition(self._lock)
+        self._pending = {}
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_behind, daemon=True)
+        self._writer.start()
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._values.get(key, default)
+
+    # Returns True if the value changed. Persisted keys are queued for the writer, listeners are woken up
+    def set(self, key, value):
+        with self._lock:
+            if self._values.get(key) == value:
+                return False
+            self._values[key] = value
+            if key in self.persist_keys:
+                self._pending[key] = value
+                self._dirty.notify()
+        logger.debug(f"Config {key} set to {value}")
+        self.notify()
+        return True
+
+    # Wake the main loop up without changing anything (e.g. a button press)
+    def notify(self):
+        self._wakeup.set()
+
+    # Block until something changes or notify is called. Returns False on timeout
+    def wait(self, timeout=None):
+        woken = self._wakeup.wait(timeout)
+        self._wakeup.clear()
+        return woken
+
+    def _write_behind(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._dirty.wait()
+                if not self._pending and self._closed:
+                    return
+            # Let a burst of changes settle before touching the SD card
+            if not self._closed:
+                time.sleep(self.debounce)
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            try:
+                write_env_file(self.path, pending)
+                logger.debug(f"Config persisted {list(pending)} to {self.path}")
+            except Exception as e:
+                logger.error(f"Failed to persist config to {self.path}: {e}")
+
+    # Write anything still pending and stop the writer thread
+    def close(self, timeout=5):
+        with self._lock:
+            self._closed = True
+            self._dirty.notify()
+        self._writer.join(timeout)
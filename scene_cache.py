@@ -0,0 +1,156 @@
+import time
+import threading
+from collections import Counter, OrderedDict
+import cv2
+import numpy as np
+from preprocess import dhash
+
+### This is scene_cache.py ###
+# Narrations of scenes we have already described. Users often ask about the same spot again (the same
+# doorway, the same kitchen) and the vision model takes seconds to say what it said last time.
+# Frames are keyed by a 64 bit perceptual hash (dHash or pHash) plus the prompt style; a new frame
+# whose hash is within a few bits (Hamming distance) of a cached one is treated as the same scene.
+# The hashes live in a BK-tree so a lookup only visits a handful of entries, not the whole cache.
+
+DEFAULT_DISTANCE = 6  # Bits out of 64, about what camera noise and a small step sideways change
+
+
+# FUNC: Number of bits that differ between two hashes
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+DCT_32 = _dct_matrix(32)
+
+
+# FUNC: Perceptual (DCT) hash of a frame as a 64 bit int
+# Keeps the signs of the lowest 8x8 frequencies of a 32x32 grayscale thumbnail against their median,
+# slower than dhash but steadier under lighting changes.
+def phash(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float64)
+    low = (DCT_32 @ small @ DCT_32.T)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+HASHES = {"dhash": dhash, "phash": phash}
+
+
+class BKTree:
+    """Burkhard-Keller tree of hashes under Hamming distance. Hashes are only added; the cache rebuilds
+    the tree when too many of them have been evicted."""
+
+    def __init__(self, values=()):
+        self.root = None
+        self.size = 0
+        for value in values:
+            self.add(value)
+
+    def add(self, value):
+        if self.root is None:
+            self.root = (value, {})
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (value, {})
+                self.size += 1
+                return
+            node = child
+
+    # All (distance, value) within max_distance of value, nearest first
+    def search(self, value, max_distance):
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node_value, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                found.append((distance, node_value))
+            # Triangle inequality: only children at distance +/- max_distance can hold a match
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(found)
+
+
+class SceneCache:
+    """Narrations by (perceptual hash, prompt), matched within max_distance bits.
+
+    Entries expire after ttl seconds and the least recently used go first past max_entries.
+    """
+
+    def __init__(self, ttl=300.0, max_entries=256, max_distance=DEFAULT_DISTANCE, method="dhash", clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.hash_frame = HASHES[method]
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hashes = Counter()
+        self.tree = BKTree()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _remove(self, key):
+        del self.entries[key]
+        self.hashes[key[0]] -= 1
+        if not self.hashes[key[0]]:
+            del self.hashes[key[0]]
+        # Evicted hashes stay in the tree until they outnumber the live ones
+        if self.tree.size > 2 * len(self.hashes) + 32:
+            self.tree = BKTree(self.hashes)
+
+    # The cached narration for the nearest matching scene, or None
+    def get(self, scene_hash, prompt):
+        with self.lock:
+            now = self.clock()
+            for _, candidate in self.tree.search(scene_hash, self.max_distance):
+                key = (candidate, prompt)
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                stored, text = entry
+                if now - stored > self.ttl:
+                    self._remove(key)
+                    continue
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return text
+            self.misses += 1
+            return None
+
+    def put(self, scene_hash, prompt, text):
+        with self.lock:
+            key = (scene_hash, prompt)
+            if key not in self.entries:
+                self.hashes[scene_hash] += 1
+                self.tree.add(scene_hash)
+            self.entries[key] = (self.clock(), text)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hashes.clear()
+            self.tree = BKTree()
@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import logging
+import threading
+from frame_archive import FrameArchive
+
+### This is session_recorder.py ###
+# Records a VisGuide session for offline performance analysis: camera frames, request payload sizes,
+# model responses, TTS byte counts and stage timings, all in one append-only JSON Lines log.
+# Frames are stored next to the log (written in the background) and referenced by name so the log itself stays small.
+# replay_session.py plays a recording back through the pipeline.
+
+logger = logging.getLogger()
+
+LOG_NAME = "session.jsonl"
+FRAMES_DIR = "frames"
+
+
+class SessionRecorder:
+    """Append-only recorder, safe to call from any thread."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # Keep every frame of the session, written off the capture path
+        self.frames = FrameArchive(os.path.join(directory, FRAMES_DIR), max_frames=None)
+        # Line buffered so a crash loses at most the event being written
+        self.log = open(os.path.join(directory, LOG_NAME), "a", buffering=1)
+        self.lock = threading.Lock()
+        self.frame_count = 0
+        self.event("session", pid=os.getpid())
+
+    def event(self, kind, **fields):
+        record = {"t": time.time(), "kind": kind}
+        record.update(fields)
+        line = json.dumps(record, separators=(",", ":"))
+        with self.lock:
+            self.log.write(line + "\n")
+
+    # Store a JPEG encoded frame and log a reference to it, returns the reference
+    def frame(self, jpeg_bytes, **fields):
+        with self.lock:
+            self.frame_count += 1
+            name = f"{self.frame_count:06d}.jpg"
+        if self.frames.add(jpeg_bytes, name) is None:
+            logger.warning("Session recorder is behind, frame dropped")
+            return None
+        ref = f"{FRAMES_DIR}/{name}"
+        self.event("frame", ref=ref, bytes=len(jpeg_bytes), **fields)
+        return ref
+
+    # Log how long a stage took, ending now
+    def stage(self, name, start, **fields):
+        self.event("stage", name=name, start=start, seconds=time.time() - start, **fields)
+
+    def close(self):
+        self.frames.close()
+        with self.lock:
+            self.log.close()
+
+
+# FUNC: Read a recorded session back as a list of events in recording order
+def read_session(directory):
+    events = []
+    with open(os.path.join(directory, LOG_NAME)) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # A torn last line after a power cut
+                logger.warning(f"Skipping unreadable line in {directory}/{LOG_NAME}")
+    return events
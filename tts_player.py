@@ -0,0 +1,163 @@
+import mmap
+import time
+import logging
+import threading
+from deadline import Cancelled
+
+try:
+    import mpv
+except OSError:
+    # libmpv isn't installed, visguide.py falls back to elevenlabs.stream (an mpv subprocess per narration)
+    mpv = None
+
+### This is tts_player.py ###
+# Plays the ElevenLabs audio stream in process through the bundled mpv.py, with one libmpv player
+# created at boot instead of an mpv process spawned (and its decoder started) for every narration.
+# The audio chunks reach libmpv through a python:// stream. A new button press stops playback
+# immediately, and each narration reports its time to first sample.
+
+logger = logging.getLogger()
+
+
+class PlaybackError(Exception):
+    """libmpv couldn't play the narration (the stream couldn't be opened or decoded, the audio output failed or
+    the core shut down). replay, if not None, gives the received audio again from the start for a fallback player."""
+
+    def __init__(self, message, replay=None):
+        super().__init__(message)
+        self.replay = replay
+
+
+class ReplayableChunks:
+    """Makes a one-shot iterator of audio chunks readable from the start again.
+
+    libmpv reads the start of a stream to probe the format and then seeks back to 0, which calls the
+    python:// generator function again. Chunks already received are replayed, the rest come from the
+    source. An error from the source (a deadline, the network) ends the stream and is kept in .error.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.received = []
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.error = None
+        self.first_chunk_time = None
+        self.bytes = 0
+
+    def _chunk(self, index):
+        with self.lock:
+            while len(self.received) <= index:
+                if self.cancelled or self.error is not None:
+                    return None
+                try:
+                    chunk = next(self.chunks)
+                except StopIteration:
+                    return None
+                except Exception as e:
+                    self.error = e
+                    return None
+                if chunk:
+                    if self.first_chunk_time is None:
+                        self.first_chunk_time = time.time()
+                    self.bytes += len(chunk)
+                    self.received.append(chunk)
+            return self.received[index]
+
+    # The python:// generator function
+    def __call__(self):
+        index = 0
+        while True:
+            chunk = self._chunk(index)
+            if chunk is None:
+                return
+            yield chunk
+            index += 1
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TTSPlayer:
+    """One persistent libmpv player for narration audio. play() blocks until the narration ends;
+    stop() (from any thread) or the cancel_event cuts it short straight away."""
+
+    def __init__(self, audio_buffer=0.1, **mpv_options):
+        if mpv is None:
+            raise RuntimeError("libmpv is not available")
+        self.player = mpv.MPV(video=False, ytdl=False, input_default_bindings=False, cache="no",
+                              audio_buffer=audio_buffer, **mpv_options)
+        self.lock = threading.Lock()
+        self.ended = threading.Event()
+        self.ended.set()
+        self.first_sample_time = None
+        self.end_error = None
+        self.current = None
+        self.count = 0
+        self.player.register_event_callback(self._on_event)
+
+    def _on_event(self, event):
+        event_id = event.event_id.value
+        # Playback (re)starts once the first decoded samples go to the audio output
+        if event_id == mpv.MpvEventID.PLAYBACK_RESTART and self.first_sample_time is None:
+            self.first_sample_time = time.time()
+        elif event_id == mpv.MpvEventID.END_FILE:
+            end = event.data
+            if end.reason == mpv.MpvEventEndFile.ERROR:
+                self.end_error = f"libmpv couldn't play the narration ({mpv.ErrorCode.human_readable(end.error)})"
+            self.ended.set()
+        elif event_id == mpv.MpvEventID.SHUTDOWN:
+            self.end_error = "libmpv core shut down"
+            self.ended.set()
+
+    # Play an iterator of audio chunks, or cached audio (bytes, an mmap or an open file) which libmpv reads in place.
+    # Returns (seconds to first chunk, seconds to first sample) from the call
+    def play(self, chunks, cancel_event=None):
+        with self.lock:
+            self.count += 1
+            name = f"tts{self.count}"
+            if isinstance(chunks, (bytes, bytearray, memoryview, mmap.mmap)) or hasattr(chunks, "readinto"):
+                source = None
+                unregister = self.player.python_stream_source(name, chunks)
+            else:
+                source = ReplayableChunks(chunks)
+                unregister = self.player.python_stream(name)(source).unregister
+            self.current = source
+            self.first_sample_time = None
+            self.end_error = None
+            self.ended.clear()
+            start = time.time()
+            try:
+                try:
+                    self.player.play(f"python://{name}")
+                except mpv.ShutdownError as e:
+                    raise PlaybackError(str(e), replay=source) from e
+                while not self.ended.wait(0.02):
+                    if cancel_event is not None and cancel_event.is_set():
+                        self.stop()
+                        raise Cancelled("narration audio cancelled")
+            finally:
+                unregister()
+                self.current = None
+            if source is not None and source.error is not None:
+                raise source.error
+            if self.end_error is not None:
+                raise PlaybackError(self.end_error, replay=source)
+            if source is None:
+                first_chunk = 0.0
+            else:
+                first_chunk = source.first_chunk_time - start if source.first_chunk_time else None
+            first_sample = self.first_sample_time - start if self.first_sample_time else None
+            logger.debug(f"TTS played, first chunk {first_chunk}, first sample {first_sample}")
+            return first_chunk, first_sample
+
+    # Stop the narration now (barge-in)
+    def stop(self):
+        source = self.current
+        if source is not None:
+            source.cancel()
+        self.player.stop()
+        self.ended.wait(1)
+
+    def close(self):
+        self.player.terminate()
@@ -1,95 +1,165 @@
 import os
-from openai import OpenAI
-import base64
 import json
 import time
-import simpleaudio as sa
-import errno
-from elevenlabs import generate, play, set_api_key, voices
+import base64
+import asyncio
+import logging
+import argparse
+import httpx
+from elevenlabs import Voice, VoiceSettings, generate, set_api_key, stream
+from frame_channel import FrameChannel
+from vision_backends import device_id, visguide_api_headers
 
 ### This is visguide-api.py ###
-
-
-
-
-def encode_image(image_path):
+# Alternative client that sends the frames published by capture.py to the VisGuide API.
+# One async HTTP client (keep-alive connections are reused) sends a new frame while the previous
+# narration is still playing, with up to --window requests in flight at once. Narrations are played
+# in the order the frames were taken.
+
+logger = logging.getLogger()
+
+DEFAULT_CONTEXT = """
+    You are a guide for blind people and your goal is to help them to understand whats happening in the picture. You also need to advise of major features along with an approximate distance in metres.
+    The image is facing forward from the user and assume that the user is traveling in the direction of the image. Advise them of any obstacles in their path and any risks they should be aware of.
+    """
+DEFAULT_PARAMETERS = {
+    "max_tokens": 64,
+    "temperature": 0.8,
+    "top_p": 1,
+    "frequency_penalty": 0.0,
+    "presence_penalty": 0.0,
+    "best_of": 1,
+}
+# Longest a wait for a frame blocks its thread, a thread can't be cancelled so this bounds how long shutdown waits
+FRAME_WAIT = 1.0
+
+
+# FUNC: Read the VisGuide API settings from the environment
+def load_settings():
+    parameters = os.environ.get('VISGUIDE_PARAMETERS')
+    return {
+        # Use the CONTEXT environment variable if it's set, otherwise use the default prompt
+        "context": os.environ.get('CONTEXT', DEFAULT_CONTEXT),
+        # VISGUIDE_PARAMETERS is a JSON object
+        "parameters": json.loads(parameters) if parameters else DEFAULT_PARAMETERS,
+        "api_key": os.environ.get('VISGUIDE_API_KEY'),
+        # Sent as X-Device-Id so a shared gateway can tell the devices apart
+        "device_id": device_id(),
+        "api_url": os.environ.get('VISGUIDE_API_URL', "https://hook.us1.make.com/6i6zpz27o4351bda655awavqsuuqvr31"),
+        "timeout": float(os.environ.get('VISGUIDE_API_TIMEOUT', 30)),
+    }
+
+
+# FUNC: Wait for the next complete frame from capture.py and return it base64 encoded
+async def encode_image(channel):
+    # Wait in short steps so a cancel (Ctrl+C) gets through even when capture.py has stopped
     while True:
-        try:
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode("utf-8")
-        except IOError as e:
-            if e.errno != errno.EACCES:
-                # Not a "file in use" error, re-raise
-                raise
-            # File is being written to, wait a bit and retry
-            time.sleep(0.1)
+        seq, jpeg = await asyncio.to_thread(channel.wait_for_frame, timeout=FRAME_WAIT)
+        if seq is not None:
+            return seq, base64.b64encode(jpeg).decode("utf-8")
+
 
 # Define a function called analyze_image that posts a base64 image and parameters the VisGuide API
-def analyze_image(base64_image, parameters=None, script=None):
-    # Use the CONTEXT environment variable if it's set, otherwise use the default prompt
-    context = os.environ.get('CONTEXT', """
-        You are a guide for blind people and your goal is to help them to understand whats happening in the picture. You also need to advise of major features along with an approximate distance in metres.    
-        The image is facing forward from the user and assume that the user is traveling in the direction of the image. Advise them of any obstacles in their path and any risks they should be aware of.
-        """)
-    # Use the PARAMETERS environment variable if it's set, otherwise use the default prompt
-
-    parameters = os.enviro.get('VISGUIDE_PARAMETERS', {
-        "max_tokens": 64,
-        "temperature": 0.8,
-        "top_p": 1,
-        "frequency_penalty": 0.0,
-        "presence_penalty": 0.0,
-        "best_of": 1,
-    })
-    # Use the VISGUIDE_API_KEY environment variable if it's set, otherwise use the default prompt
-    api_key = os.environ.get('VISGUIDE_API_KEY', "YOUR_API_KEY_HERE")
-    # Use the VISGUIDE_API_URL environment variable if it's set, otherwise use the default prompt
-    api_url = os.environ.get('VISGUIDE_API_URL', "https://hook.us1.make.com/6i6zpz27o4351bda655awavqsuuqvr31")
-    # Use the VISGUIDE_API_MODEL environment variable if it's set, otherwise use the default prompt
-    model = os.environ.get('VISGUIDE_API_MODEL', "visguide")
-    # Use the VISGUIDE_API_VERSION environment variable if it's set, otherwise use the default prompt
-    version = os.environ.get('VISGUIDE_API_VERSION', "v1")
-    # Use the VISGUIDE_API_TIMEOUT environment variable if it's set, otherwise use the default prompt
-    timeout = os.environ.get('VISGUIDE_API_TIMEOUT', 30)
-
-    # Send the request to the VisGuide API
-    response = requests.post(
-        f"{api_url}",
+async def analyze_image(client, settings, base64_image, script=None):
+    response = await client.post(
+        settings["api_url"],
         json={
-            "context": context,
-            "parameters": parameters,
-            "script": script,
+            "context": settings["context"],
+            "parameters": settings["parameters"],
+            "script": script or [],
             "image": base64_image,
         },
-        headers={"Authorization": f"Bearer {api_key}"},
-        timeout=timeout,
+        headers=visguide_api_headers(settings["api_key"], settings["device_id"]),
+    )
+    response.raise_for_status()
+    narrative = response.json()
+    # The API answers with {"text": "..."} (older versions returned the text on its own)
+    return narrative["text"] if isinstance(narrative, dict) else narrative
+
+
+# FUNC: Generate the narration audio with ElevenLabs and play it (blocking, run in a thread)
+def play_audio(text):
+    set_api_key(os.environ.get("ELEVENLABS_API_KEY"))
+    audio_stream = generate(
+        text=text,
+        voice=Voice(
+            voice_id=os.environ.get("ELEVENLABS_VOICE_ID"),
+            settings=VoiceSettings(stability=0.71, similarity_boost=0.5, style=0.0, use_speaker_boost=True)),
+        model="eleven_turbo_v2",
+        stream=True,
+        stream_chunk_size=4096
     )
+    stream(audio_stream)
+
+
+class Narrator:
+    """Sends frames with a bounded number of requests in flight and plays the answers in order."""
+
+    def __init__(self, channel, settings, window=2, interval=1.0):
+        self.channel = channel
+        self.settings = settings
+        self.interval = interval
+        self.window = window
+        self.in_flight = asyncio.Semaphore(window)
+        # Bounded too, so narrations can't pile up behind a slow speaker and go stale
+        self.narrations = asyncio.Queue(maxsize=window)
+        self.script = []
+
+    async def send_frames(self, client):
+        while True:
+            # Don't take a frame until a request slot is free, so the frame is as fresh as possible
+            await self.in_flight.acquire()
+            seq, base64_image = await encode_image(self.channel)
+            print(f"👀 Sending frame {seq} to VisGuide API......")
+            request = asyncio.create_task(self._analyze(client, seq, base64_image, list(self.script)))
+            await self.narrations.put((seq, time.time(), request))
+            await asyncio.sleep(self.interval)
+
+    async def _analyze(self, client, seq, base64_image, script):
+        try:
+            return await analyze_image(client, self.settings, base64_image, script)
+        finally:
+            self.in_flight.release()
+
+    async def play_narrations(self):
+        while True:
+            seq, sent, request = await self.narrations.get()
+            try:
+                analysis = await request
+            except Exception as e:
+                logger.error(f"Frame {seq} failed: {e}")
+                continue
+            print(f"🎙️ VisGuide says (frame {seq}, {time.time() - sent:.1f}s):")
+            print(analysis)
+            # Playing happens in a thread so the next frame is sent while this one is spoken
+            try:
+                await asyncio.to_thread(play_audio, analysis)
+            except Exception as e:
+                # Keep narrating, the next frame may well play. Unheard narrations stay out of the script
+                logger.error(f"Playing frame {seq} failed: {e}")
+                continue
+            self.script = self.script + [{"role": "assistant", "content": analysis}]
+
+    async def run(self):
+        limits = httpx.Limits(max_connections=self.window, max_keepalive_connections=self.window)
+        async with httpx.AsyncClient(timeout=self.settings["timeout"], limits=limits) as client:
+            await asyncio.gather(self.send_frames(client), self.play_narrations())
 
-    # Return the response
-    return response.json()
 
 def main():
-
-    while True:
-        # path to your image
-        image_path = os.path.join(os.getcwd(), "./frames/frame.jpg")
-
-        # getting the base64 encoding
-        base64_image = encode_image(image_path)
-
-        # analyze posture
-        print("👀 Sending image to VisGuide API......")
-        narrative = analyze_image(base64_image, script=script)
-
-        print("🎙️ VisGuide says:")
-        print(narrative.text)
-
-        play_audio(analysis)
-
-        script = script + [{"role": "assistant", "content": analysis}]
-
-        # wait for 5 seconds
-        time.sleep(5)
+    parser = argparse.ArgumentParser(description="VisGuide API client")
+    parser.add_argument("-w", "--window", type=int, default=2, help="Max requests in flight")
+    parser.add_argument("-i", "--interval", type=float, default=1.0, help="Min seconds between sending frames")
+    args = parser.parse_args()
+
+    # Frames are published by capture.py through shared memory
+    channel = FrameChannel.attach()
+    try:
+        asyncio.run(Narrator(channel, load_settings(), args.window, args.interval).run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        channel.close()
 
 
 if __name__ == "__main__":
@@ -1,12 +1,8 @@
 import sys
-import fileinput
 import threading
 from threading import Lock
 from dotenv import load_dotenv
 import cv2
-from PIL import Image
-import numpy as np
-import base64
 import time
 import subprocess
 import simpleaudio as sa
@@ -16,6 +12,19 @@ import argparse
 import logging
 from logging.handlers import SysLogHandler
 import os  # Ensure os is imported for session ID generation
+import preprocess
+import obstacle
+import vision_backends
+import deadline
+import prompt_registry
+import runtime_config
+import frame_source
+import session_recorder
+import frame_archive
+import scene_cache
+import preprocess_worker
+import tts_player
+import itertools
 
 # FUNC: Custom logging formatter with Session ID
 class CustomFormatter(logging.Formatter):
@@ -37,8 +46,17 @@ parser.add_argument("-d", "--debug", action="store_true")
 parser.add_argument("-s", "--syslog", action="store_true")
 parser.add_argument("-t", "--target_host", type=str, help="Target host for syslog")
 parser.add_argument("-p", "--target_port", type=int, help="Target port for syslog")
+parser.add_argument("--hazard", action="store_true", help="Enable on-device obstacle alerts")
+parser.add_argument("--archive-frames", type=int, default=50, help="With --debug, how many recent frames to keep in ./frames")
+parser.add_argument("--archive-segment", action="store_true", help="With --debug, keep the frames in one memory-mapped segment file")
+parser.add_argument("-r", "--record", type=str, help="Record the session (frames, payloads, responses, timings) to this directory")
+parser.add_argument("-c", "--camera", type=str, default="0", help="Camera index, video file, image or directory of images")
+parser.add_argument("--preprocess-worker", action="store_true", help="Resize and encode the captures in a separate process")
 args = parser.parse_args()
 
+# Started first: the worker is forked, so nothing else (threads, camera) should be running yet
+preprocessor = preprocess_worker.PreprocessWorker() if args.preprocess_worker else preprocess_worker.InlinePreprocessor()
+
 # ACTION: Generate a unique session ID
 session_id = os.urandom(8).hex()
 
@@ -142,17 +160,6 @@ def is_device_connected(device_name):
 
     return False
 
-def delete_frames(directory):
-    for file in os.listdir(directory):
-        file_path = os.path.join(directory, file)
-        try:
-            os.remove(file_path)
-            logging.info(f"Deleting file: {file_path}")
-        except FileNotFoundError:
-            logging.error(f"File not found: {file_path}")
-        except Exception as e:
-            logging.error(f"Error deleting file {file_path}: {e}")
-    
 def reload_camera_driver(module_name):
     try:
         # Unload the camera module
@@ -191,9 +198,9 @@ else:
 
 # ACTION: load the environment variables from the .env file if they are not set
 logger.debug("TIMING:Start TYPE:Action DESC:Load .env RESULT:None")
+dotenv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
 if 'OPENAI_API_KEY' not in os.environ or 'ELEVENLABS_API_KEY' not in os.environ or 'ELEVENLABS_VOICE_ID' not in os.environ:
         # If not set, check for .env file and load it
-        dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
         if os.path.exists(dotenv_path):
             load_dotenv(dotenv_path)
             logger.debug("TIMING:End TYPE:Action DESC:Load .env RESULT:Loaded")
@@ -207,6 +214,14 @@ SINGLE_PRESS_MAX = 0.5  # Max duration for a single press (seconds)
 DOUBLE_PRESS_INTERVAL = 0.5  # Max interval between double presses (seconds)
 TRIPLE_PRESS_INTERVAL = 0.5  # Max interval between triple presses (seconds)
 LONG_PRESS_MIN = 1  # Min duration for a long press (seconds)
+E2E_BUDGET = float(os.environ.get('VISGUIDE_BUDGET', 4))  # Target from button press to first audio (seconds)
+ANALYZE_TIMEOUT = float(os.environ.get('VISGUIDE_ANALYZE_TIMEOUT', 15))  # Hard limit for the vision request incl. retries (seconds)
+TTS_TIMEOUT = float(os.environ.get('VISGUIDE_TTS_TIMEOUT', 8))  # Hard limit for the first audio chunk incl. retries (seconds)
+CHANGE_THRESHOLD = float(os.environ.get('VISGUIDE_CHANGE_THRESHOLD', 0))  # Continuous mode stays quiet while the scene changes less than this (0 to 1, 0 is off)
+SCENE_CACHE_TTL = float(os.environ.get('VISGUIDE_SCENE_CACHE_TTL', 0))  # How long a Tourist narration is reused for the same scene, a few seconds at most, 0 is off (seconds)
+# Only Tourist narrations are ever reused. A Guide narration is about hazards, and a person or car entering the frame
+# barely moves the scene hash, so it is always asked fresh
+SCENE_CACHE_STYLES = ('Tourist',)
 
 # Global variables to track press patterns
 last_press_time = 0
@@ -217,12 +232,46 @@ button_state = False
 global Action, script, timings
 Action = "None"
 interrupt_main_process = False
-stop_audio_stream = False
+# Set by a new button press to cancel the narration in progress (retries, analysis and audio)
+cancel_event = threading.Event()
+press_time = 0
 imagenum = 0
-voice_id = os.environ.get("ELEVENLABS_VOICE_ID")
+scene_hash = None
+scene_change = 1.0
 device_name = "Jabra Speak 710"
+# Runtime settings live in memory, VISSTYLE is written back to .env in the background
+config = runtime_config.RuntimeConfig(
+    {key: os.environ.get(key) for key in ('VISMODE', 'VISSTYLE', 'VISROI', 'ELEVENLABS_VOICE_ID', 'TOURIST_VOICE_ID')},
+    path=dotenv_path,
+    persist_keys=('VISSTYLE',),
+)
+voice_id = config.get("ELEVENLABS_VOICE_ID")
+# Session recorder for offline performance analysis, see replay_session.py
+recorder = session_recorder.SessionRecorder(args.record) if args.record else None
+# When debugging the frames sent are archived to ./frames in the background, keeping a rolling window
+archive = frame_archive.FrameArchive("frames", max_frames=args.archive_frames, segment=args.archive_segment) if args.debug else None
+# FUNC: Region of interest upload mode for a style. Tourist describes the whole scene so sends the full frame,
+# Guide cares about the path ahead so sends the cropped region plus a context thumbnail unless VISROI says otherwise
+def style_roi_mode(style):
+    if style == 'Tourist':
+        return preprocess.ROI_OFF
+    override = config.get('VISROI')
+    if override and override not in preprocess.ROI_MODES:
+        logger.warning(f"VISROI={override} is not one of {', '.join(preprocess.ROI_MODES)}, using {preprocess.ROI_CONTEXT}")
+        override = None
+    return override or preprocess.ROI_CONTEXT
+
+
+roi_mode = style_roi_mode(config.get('VISSTYLE'))
+# Narrations of recently described scenes, a single press on the same spot is answered without the vision model (Tourist style only)
+scenes = scene_cache.SceneCache(ttl=SCENE_CACHE_TTL) if SCENE_CACHE_TTL > 0 else None
 logger.debug("TIMING:End TYPE:Action DESC:Define global variables RESULT:Done")
 
+# FUNC: Add an event to the session recording, if recording
+def record(kind, **fields):
+    if recorder:
+        recorder.event(kind, **fields)
+
 # FUNC: Space Key press event handler
 def keyboard_event(event):
     logger.debug("TIMING:Start TYPE:Func DESC:Keyboard Event RESULT:None")
@@ -278,56 +327,35 @@ def check_press_count(press_duration):
             handle_triple_press()
         press_count = 0
 
-# ACTION: Preload into variables the prompts from prompts.txt. Each line is a key value pair separated by an equals sign
-# Open the prompts.txt file
+# ACTION: Load the prompts from prompts.txt once. Each line is a PROMPT_<Name>="<prompt>" pair
 logger.debug("TIMING:Start TYPE:Action DESC:Preload prompts RESULT:None")
-with open('./prompts.txt') as f:
-    # each line is a key value pair separated by an equals sign
-    # read each line, one at a time, and split it into a key and value
-    for line in f:
-        key, value = line.split('=')
-        # remove any whitespace from the key and value
-        key = key.strip()
-        value = value.strip()
-        # Assign the value to a global variable with the key as the variable name
-        globals()[key] = value
-        # Log the value of the global variable
-        # logger.debug(f"Value of global variable {key}: {globals()[key]}")
-    # List each global variable that starts with PROMPT
-    #logger.debug(f"List of global variables that start with PROMPT: {[key for key in globals().keys() if key.startswith('PROMPT')]}")
-logger.debug("TIMING:End TYPE:Action DESC:Preload prompts RESULT:Prompts loaded")
-if os.environ.get('VISSTYLE') == 'Guide':
-    context = os.environ.get('PROMPT_Guide')
-elif os.environ.get('VISSTYLE') == 'Tourist':
-    context = os.environ.get('PROMPT_Tourist')
-
-# FUNC: Define a function to find a line in a file starting with something specific and replace it with a new line
-def replace_line_in_file(file_path, line_starts_with, new_line):
-    logger.debug("TIMING:Start TYPE:Func DESC:replace_line_in_file RESULT:None")
-        # Read the file line by line
-    for line in fileinput.input(file_path, inplace=True):
-        if line.strip().startswith(line_starts_with):
-            line = new_line
-        sys.stdout.write(line)
-    logger.debug("TIMING:End TYPE:Func DESC:replace_line_in_file RESULT:Done")
-
+prompts = prompt_registry.load_prompts('./prompts.txt')
+logger.debug(f"TIMING:End TYPE:Action DESC:Preload prompts RESULT:Prompts loaded {prompts.names()}")
+if config.get('VISSTYLE') == 'Tourist':
+    context = prompts['Tourist']
+else:
+    context = prompts['Guide']
 
 # FUNC: Handlers for different press types
 def handle_single_press(press_duration):
     logger.debug("TIMING:Start TYPE:Func DESC:handle_single_press RESULT:None")
-    global context, Action, interrupt_main_process, voice_id
+    global context, Action, interrupt_main_process, voice_id, roi_mode, press_time
     if press_duration < SINGLE_PRESS_MAX:
         logger.info("Single Press Detected")
-        voice_id = os.environ.get("ELEVENLABS_VOICE_ID")
-        # Set the stop_audio_stream flag to True
-        stop_audio_stream = True
+        voice_id = config.get("ELEVENLABS_VOICE_ID")
+        roi_mode = style_roi_mode('Guide')
+        # Cancel any narration in progress and start the press to first audio clock
+        press_time = time.time()
+        cancel_event.set()
+        record("press", gesture="single")
         # Set the Action variable to equal Single
         Action = "Single"
         logger.debug(f"Single Press Loop: Action = {Action}")
-        # Set the context variable to equal the value of the PROMPT_Guide global variable
-        context = globals()['PROMPT_Guide']
+        # Set the context to the Guide prompt
+        context = prompts['Guide']
 
         interrupt_main_process = True
+        config.notify()
         # Play the camera click sound
         wave_obj = sa.WaveObject.from_wave_file("./assets/wav/camera-capture.wav")
         play_obj = wave_obj.play()
@@ -338,17 +366,22 @@ def handle_single_press(press_duration):
 
 def handle_double_press():
     logger.debug("TIMING:Start TYPE:Func DESC:handle_double_press RESULT:None")
-    global context, press_count, Action, stop_audio_stream, voice_id
-    voice_id = os.environ.get("TOURIST_VOICE_ID")
+    global context, press_count, Action, voice_id, roi_mode, press_time
+    voice_id = config.get("TOURIST_VOICE_ID")
+    roi_mode = style_roi_mode('Tourist')
     press_count = 0
     logger.info("Double Press Detected")
     # Implement double press action
-    stop_audio_stream = True
+    # Cancel any narration in progress and start the press to first audio clock
+    press_time = time.time()
+    cancel_event.set()
+    record("press", gesture="double")
     Action = "Single"
     logger.debug(f"Double Press Loop: Action = {Action}")
-    # Set the context variable to equal the value of the PROMPT_Guide global variable
-    context = globals()['PROMPT_Tourist']
+    # Set the context to the Tourist prompt
+    context = prompts['Tourist']
     logger.debug(f"Double Press Loop: context = {context}")
+    config.notify()
     # Play the camera click sound
     wave_obj = sa.WaveObject.from_wave_file("./assets/wav/camera-capture.wav")
     play_obj = wave_obj.play()
@@ -362,34 +395,31 @@ def handle_triple_press():
     press_count = 0
     logger.info("Triple Press Detected")
     # Implement triple press action
-    # Toggle the style based on the current style
-    if os.environ.get('VISSTYLE') == 'Guide':
-        os.environ['VISSTYLE'] = 'Tourist'
-        voice_id = os.environ.get("TOURIST_VOICE_ID") 
+    # Toggle the style based on the current style, the new style is written to .env in the background
+    if config.get('VISSTYLE') == 'Guide':
+        config.set('VISSTYLE', 'Tourist')
+        voice_id = config.get("TOURIST_VOICE_ID")
         # Play the user warning audio file
         wave_obj = sa.WaveObject.from_wave_file("./assets/wav/You_have_selected_tourist_style_narration.wav")
         play_obj = wave_obj.play()
         logger.info("VISSTYLE set to Tourist")
-        replace_line_in_file(".env", "export VISSTYLE", f"export VISSTYLE=\"{os.environ.get('VISSTYLE')}\"\n")
 
-    elif os.environ.get('VISSTYLE') == 'Tourist':
-        os.environ['VISSTYLE'] = 'Guide'
-        voice_id = os.environ.get("ELEVENLABS_VOICE_ID") 
+    elif config.get('VISSTYLE') == 'Tourist':
+        config.set('VISSTYLE', 'Guide')
+        voice_id = config.get("ELEVENLABS_VOICE_ID")
         # Play the user warning audio file
         wave_obj = sa.WaveObject.from_wave_file("./assets/wav/You_have_selected_guide_style_narration.wav")
         play_obj = wave_obj.play()
         logger.info("VISSTYLE set to Guide")
-        replace_line_in_file(".env", "export VISSTYLE", f"export VISSTYLE=\"{os.environ.get('VISSTYLE')}\"\n")
 
     else:
-        logger.warning("VISSTYLE environment variable not set")
-        os.environ['VISSTYLE'] = 'Guide'
+        logger.warning("VISSTYLE not set")
+        config.set('VISSTYLE', 'Guide')
         logger.info("VISSTYLE set to Guide")
-        logger.debug(f"VISSTYLE = {os.environ.get('VISSTYLE')}")
+        logger.debug(f"VISSTYLE = {config.get('VISSTYLE')}")
         # Play the user warning audio file
         wave_obj = sa.WaveObject.from_wave_file("./assets/wav/You_have_selected_guide_style_narration.wav")
         play_obj = wave_obj.play()
-        replace_line_in_file(".env", "export VISSTYLE", f"export VISSTYLE=\"{os.environ.get('VISSTYLE')}\"\n")
     play_obj.wait_done()
     logger.debug("TIMING:End TYPE:Func DESC:handle_triple_press RESULT:Triple press executed")
 
@@ -400,30 +430,29 @@ def handle_long_press():
     press_count = 0
     logger.info("Long Press Detected")
     # Implement long press action
-    # Set the VISMODE environment variable
-    if os.environ.get('VISMODE') == 'Single':
-        os.environ['VISMODE'] = 'Continuous'
+    # Set the VISMODE, this wakes the main loop up
+    if config.get('VISMODE') == 'Single':
+        config.set('VISMODE', 'Continuous')
         # Play the user warning audio file
         wave_obj = sa.WaveObject.from_wave_file("./assets/wav/You_have_selected_continuous_mode.wav")
         play_obj = wave_obj.play()
         play_obj.wait_done()
         logger.info("VISMODE set to Continuous")
-    elif os.environ.get('VISMODE') == 'Continuous':
-        os.environ['VISMODE'] = 'Single'
+    elif config.get('VISMODE') == 'Continuous':
+        config.set('VISMODE', 'Single')
         # Play the user warning audio file
         wave_obj = sa.WaveObject.from_wave_file("./assets/wav/You_have_selected_single_mode.wav")
         play_obj = wave_obj.play()
         logger.info("VISMODE set to Single")
     else:
-        logger.warning("VISMODE environment variable not set")
-        os.environ['VISMODE'] = 'Single'
+        logger.warning("VISMODE not set")
+        config.set('VISMODE', 'Single')
         logger.info("VISMODE set to Single")
-        logger.debug(f"VISMODE = {os.environ.get('VISMODE')}")
+        logger.debug(f"VISMODE = {config.get('VISMODE')}")
         # Play the user warning audio file
         wave_obj = sa.WaveObject.from_wave_file("./assets/wav/You_have_selected_single_mode.wav")
         play_obj = wave_obj.play()
-    # Write the updated value to the .env file
-    # replace_line_in_file(".env", "export VISMODE", f"export VISMODE=\"{os.environ.get('VISMODE')}\"\n")
+    # VISMODE isn't persisted, every boot starts in the mode from .env
     play_obj.wait_done()
     logger.debug("TIMING:End TYPE:Func DESC:handle_long_press RESULT:Long press executed")
 
@@ -464,21 +493,43 @@ def listen_for_key():
 
 # ACTION: Initialize the webcam
 logger.debug("TIMING:Start TYPE:Action DESC:Initialize the webcam RESULT:None")
-cap = cv2.VideoCapture(0)
+cap = frame_source.open_frame_source(args.camera)
 # Check if the webcam is opened correctly
 if not cap.isOpened():
     logger.warning("Failed to open webcam")
     raise IOError("Cannot open webcam")
     exit(1)
+# The capture and the hazard monitor share the webcam
+cap_lock = Lock()
 # Wait for the camera to initialize and adjust light levels
 time.sleep(2)
 logger.debug("TIMING:End TYPE:Action DESC:Initialize the webcam RESULT:Webcam initialized")
 
 # ACTION: Create an OpenAI client
 logger.debug("TIMING:Start TYPE:Action DESC:Create OpenAI client RESULT:None")
-client = OpenAI()
+# OPENAI_BASE_URL points the client at a proxy or the local benchmark server
+client = OpenAI(base_url=os.environ.get('OPENAI_BASE_URL'))
 logger.debug("TIMING:Start TYPE:Action DESC:Create OpenAI client RESULT:Created")
 
+# ACTION: Set up the vision backends, the VisGuide API is only used when VISGUIDE_API_URL is set
+logger.debug("TIMING:Start TYPE:Action DESC:Create vision router RESULT:None")
+vision_backend_list = [vision_backends.OpenAIVisionBackend(client)]
+if os.environ.get('VISGUIDE_API_URL'):
+    vision_backend_list.append(vision_backends.VisGuideAPIBackend(os.environ.get('VISGUIDE_API_URL'), os.environ.get('VISGUIDE_API_KEY')))
+# Fire the next best backend as well if the first hasn't answered within VISGUIDE_HEDGE_AFTER seconds
+vision_router = vision_backends.BackendRouter(vision_backend_list, hedge_after=float(os.environ.get('VISGUIDE_HEDGE_AFTER', 2.5)))
+logger.debug(f"TIMING:End TYPE:Action DESC:Create vision router RESULT:{len(vision_backend_list)} backends")
+
+# ACTION: Create the audio player once, narrations play in process through libmpv
+# Without libmpv elevenlabs.stream is used, which starts an mpv process for every narration
+logger.debug("TIMING:Start TYPE:Action DESC:Create audio player RESULT:None")
+try:
+    audio_player = tts_player.TTSPlayer()
+    logger.debug("TIMING:End TYPE:Action DESC:Create audio player RESULT:In process")
+except Exception as e:
+    audio_player = None
+    logger.debug(f"TIMING:End TYPE:Action DESC:Create audio player RESULT:Using elevenlabs.stream ({e})")
+
 # # Set the ElevenLabs API key 
 # set_api_key(os.environ.get("ELEVENLABS_API_KEY"))
 
@@ -529,75 +580,73 @@ def check_internet(timeout=60, max_response_time=30):  # Default timeout is 60 s
 
 # FUNC: Capture an image from the webcam and return it as a base64 encoded string
 def capture_image():
-    global imagenum
+    global imagenum, scene_hash, scene_change
     logger.debug("TIMING:Start TYPE:Func DESC:Capture image RESULT:None")
+    scene_hash = None
 
     # Clear the camera buffer by reading a few frames
     # This fixed the issue of the same image being used each time
     logger.debug("TIMING:Start TYPE:Sub Func DESC:Clear camera buffer RESULT:None")
-    for _ in range(5):  # Adjust the range as needed
-        cap.read()  # Read and discard frame
-    logger.debug("TIMING:End TYPE:Sub Func DESC:Clear camera buffer RESULT:Camera buffer cleared")
+    with cap_lock:
+        for _ in range(5):  # Adjust the range as needed
+            cap.read()  # Read and discard frame
+        logger.debug("TIMING:End TYPE:Sub Func DESC:Clear camera buffer RESULT:Camera buffer cleared")
 
-    ret, frame = cap.read()
+        ret, frame = cap.read()
     if ret:
 
         # Mirror the image
         # frame = cv2.flip(frame, 1)
 
-        # Convert the frame to a PIL image
-        pil_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-
-        # Resize the image
-        max_size = 250
-        ratio = max_size / max(pil_img.size)
-        new_size = tuple([int(x*ratio) for x in pil_img.size])
-        resized_img = pil_img.resize(new_size, Image.LANCZOS)
-
-        # Convert the PIL image back to an OpenCV image
-        frame = cv2.cvtColor(np.array(resized_img), cv2.COLOR_RGB2BGR)
-
-        # Encode the image as base64
-        frame_jpg = cv2.imencode('.jpg', frame)[1]
-        frame = base64.b64encode(frame_jpg).decode("utf-8")
-
-        # If debugging, save the frame as an image file
-        if args.debug:
-            logger.debug("TIMING:Start TYPE:Sub Func DESC:Write image to file RESULT:None")
-            # Create a folder to store the frames if it doesn't exist
-            folder = "frames"
-            if not os.path.exists(folder):
-                logger.debug("Creating folder to store frames")
-                os.makedirs(folder, exist_ok=True)
-            else:
-                logger.debug("Folder to store frames already exists")
-                delete_frames(folder)
+        # Resize (and crop to the region of interest) then encode the image(s) as base64
+        # (in the preprocess worker with --preprocess-worker), with the scene hash and how much it changed
+        logger.debug(f"TIMING:Start TYPE:Sub Func DESC:Prepare upload RESULT:{roi_mode}")
+        prepared = preprocessor.process(frame, roi_mode, keep_full=recorder is not None)
+        images = prepared["images"]
+        frame_jpg = images[0][0]
+        scene_hash = prepared["scene_hash"]
+        scene_change = prepared["change"]
+        logger.debug(f"TIMING:End TYPE:Sub Func DESC:Prepare upload RESULT:{sum(len(b64) for _, b64 in images)} bytes, change {scene_change:.3f}")
+
+        # If recording, keep the full camera frame so a replay can redo the preprocessing
+        if recorder:
+            recorder.frame(prepared["full_jpeg"].tobytes(), roi_mode=roi_mode,
+                           upload_bytes=sum(len(b64) for _, b64 in images), change=scene_change)
+
+        # If debugging, queue the frame for the archive writer (it's written in the background)
+        if archive:
             imagenum += 1
-            path = f"{folder}/frame{imagenum}.jpg"
-            logger.debug(f"Saving frame to {path}")
-            cv2.imwrite(path, frame_jpg)
-            logger.debug("TIMING:End TYPE:Sub Func DESC:Write image to file RESULT:File written to disk")
+            logger.debug(f"Archiving frame{imagenum}.jpg")
+            archive.add(frame_jpg.tobytes(), f"frame{imagenum}.jpg")
         # Delete the JPG version of the frame to save memory
         del frame_jpg
-        # Return the base64 encoded image
+        # Return the base64 encoded image(s), main image first
         logger.debug("TIMING:End TYPE:Func DESC:Capture image RESULT:Completed and returned frame")
-        return frame
+        return [b64 for _, b64 in images]
     else:
         #logger.warning("Failed to capture image")
         logger.debug("TIMING:End TYPE:Func DESC:Capture image RESULT:Completed func but failed to capture image")
 
+# FUNC: Read a single frame for the hazard monitor
+def read_hazard_frame():
+    with cap_lock:
+        ret, frame = cap.read()
+    return frame if ret else None
+
+# FUNC: Play the short hazard cue, this doesn't wait for the narration or the cloud
+hazard_tone = obstacle.make_tone()
+def play_hazard_cue(ttc):
+    sa.play_buffer(hazard_tone, 1, 2, 22050)
+
 # FUNC: Calls the ElevenLabs API to generate an audio stream and plays it
-def play_audio(text):
+# The first chunk has to arrive within TTS_TIMEOUT (retried with jittered backoff), a new press stops playback
+def play_audio(text, budget=None):
     logger.debug("TIMING:Start TYPE:Func DESC:play_audio RESULT:None")
-    global stop_audio_stream, voice_id
-    #logger.debug(f"play_audio func started - stop_audio_stream = {stop_audio_stream}")
-    stop_audio_stream = False
-    #logger.debug(f"play_audio func step 2 - stop_audio_stream = {stop_audio_stream}")
+    global voice_id
     set_api_key(os.environ.get("ELEVENLABS_API_KEY"))
-    try:
-        # Calls the ElevenLabs API to generate an audio stream
-        logger.debug("TIMING:Start TYPE:Sub Func DESC:generate audio using Elevenlabs RESULT:None")
-        # logger.debug(f"play_audio func step 3 - call generate from API - stop_audio_stream = {stop_audio_stream}")
+
+    # Returns the audio stream once its first chunk has arrived
+    def start_audio_stream(timeout):
         audio_stream = generate(
             text=text,
             voice=Voice(
@@ -607,62 +656,88 @@ def play_audio(text):
             stream=True,
             stream_chunk_size=4096
         )
+        chunks = deadline.iter_with_deadline(audio_stream, deadline.Deadline(timeout, cancel_event=cancel_event), stage="play_audio")
+        return itertools.chain([next(chunks)], chunks)
+
+    # Counts the audio bytes for the session recording
+    def count_bytes(audio_stream):
+        tts_bytes = 0
+        try:
+            for chunk in audio_stream:
+                tts_bytes += len(chunk)
+                yield chunk
+        finally:
+            record("tts", bytes=tts_bytes, first_chunk=first_chunk_time - tts_start, seconds=time.time() - tts_start)
+
+    try:
+        # Calls the ElevenLabs API to generate an audio stream
+        logger.debug("TIMING:Start TYPE:Sub Func DESC:generate audio using Elevenlabs RESULT:None")
+        tts_start = time.time()
+        audio_stream = deadline.retry_call(start_audio_stream, deadline.Deadline(TTS_TIMEOUT, cancel_event=cancel_event), stage="play_audio")
+        first_chunk_time = time.time()
+        if recorder:
+            audio_stream = count_bytes(audio_stream)
         logger.debug("TIMING:End TYPE:Sub Func DESC:generate audio using Elevenlabs RESULT:Audio generated")
-        
-        # Play audio stream without chunking
+        if budget is not None:
+            timings['first_audio'] = time.time() - budget.start
+            if budget.expired():
+                timings['deadline_misses'] += 1
+                logger.warning(f"Press to first audio took {timings['first_audio']:.2f} seconds, over the {budget.budget:.1f} second budget")
+
+        # Play audio stream without chunking, a new press stops the in process player straight away
         logger.debug("TIMING:Start TYPE:Sub Func DESC:stream audio RESULT:None")
-        # logging.debug(f"play_audio func step 5 - Playing stream - stop_audio_stream = {stop_audio_stream}")
-        stream(audio_stream)
+        if audio_player:
+            play_start = time.time()
+            try:
+                _, first_sample = audio_player.play(audio_stream, cancel_event=cancel_event)
+            except tts_player.PlaybackError as e:
+                # Play what was received through an mpv process instead
+                logger.error(f"In process playback failed ({e}), falling back to stream()")
+                stream(e.replay() if e.replay is not None else audio_stream)
+                first_sample = None
+            if first_sample is not None:
+                logger.debug(f"Time to first sample {first_sample:.3f} seconds")
+                record("first_sample", seconds=first_sample, since_start=play_start + first_sample - (budget.start if budget else tts_start))
+        else:
+            stream(audio_stream)
         logger.debug("TIMING:End TYPE:Sub Func DESC:stream audio RESULT:Audio streamed")
-        
-        # Reset the stop flag
-        # logging.debug(f"play_audio func step 6 - Playing finished - stop_audio_stream = {stop_audio_stream}")
-        stop_audio_stream = False
-       
+
+    except deadline.Cancelled:
+        # Let the main loop pick up the new press straight away
+        logger.info("Audio cancelled by a new press")
+        raise
+    except deadline.DeadlineExceeded as e:
+        timings['deadline_misses'] += 1
+        logger.error(f"Deadline missed in play_audio: {e}")
     except Exception as e:
         logger.error(f"Error in play_audio: {e}")
 
     logger.debug("TIMING:End TYPE:Func DESC:play_audio RESULT:Paying audio completed")
 
 
-# FUNC: Generates the OpenAI "user" script
-# TODO: Explore if this an optimal prompt for each request.
-def generate_new_line(base64_image):
-    logger.debug("TIMING:Start TYPE:Func DESC:generate_new_line RESULT:None")
-    return [
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": "Describe this image"},
-                {
-                    "type": "image_url",
-                    "image_url": f"data:image/jpeg;base64,{base64_image}",
-                },
-            ],
-        },
-    ]
-
-
-# FUNC: Send image to OPENAI to get text summary back
-def analyze_image(base64_image, script):
+# FUNC: Send image to the fastest vision backend to get text summary back
+def analyze_image(base64_images, script):
     logger.debug("TIMING:Start TYPE:Func DESC:analyze_image RESULT:None")
     global context
+    if recorder:
+        record("request", style=getattr(context, "name", None), images=len(base64_images), script=len(script),
+               bytes=sum(len(b64) for b64 in base64_images) + len(context) + sum(len(str(line["content"])) for line in script))
     try:
-        response = client.chat.completions.create(
-            model="gpt-4-vision-preview",
-            messages=[
-                {
-                    "role": "system",
-                    "content": context,
-                },
-            ]
-            + script
-            + generate_new_line(base64_image),
-            max_tokens=500,
+        response_text = deadline.retry_call(
+            lambda timeout: vision_router.describe(context, script, base64_images, timeout=timeout, cancel_event=cancel_event),
+            deadline.Deadline(ANALYZE_TIMEOUT, cancel_event=cancel_event),
+            stage="analyze_image",
         )
-        response_text = response.choices[0].message.content
-        logger.debug("TIMING:End TYPE:Func DESC:analyze_image RESULT:Image analyzed")
+        logger.debug(f"TIMING:End TYPE:Func DESC:analyze_image RESULT:Image analyzed ({vision_router.report()})")
+        record("response", text=response_text)
         return response_text
+    except (deadline.DeadlineExceeded, TimeoutError) as e:
+        timings['deadline_misses'] += 1
+        logger.debug(f"TIMING:End TYPE:Func DESC:analyze_image RESULT:{e}")
+        # Don't leave the user in silence
+        wave_obj = sa.WaveObject.from_wave_file("./assets/wav/slow_internet.wav")
+        wave_obj.play()
+        raise
     except Exception as e:
         # logger.error(f"Error in analyze_image: {e}")
         logger.debug(f"TIMING:End TYPE:Func DESC:analyze_image RESULT:{e}")
@@ -671,22 +746,46 @@ def analyze_image(base64_image, script):
 # Main single loop process
 def single_loop():
     logger.debug("TIMING:Start TYPE:Func DESC:single_loop RESULT:None")
-    global Action, script, timings, voice_id, context
-    # Start the timers
-    start_time = time.time()
+    global Action, script, timings, voice_id, context, press_time
+    # Start the timers, the budget runs from the button press (or now in continuous mode)
+    cancel_event.clear()
+    start_time = press_time or time.time()
+    press_time = 0
+    budget = deadline.Deadline(E2E_BUDGET, start=start_time)
     
     # Capture the image
     logger.debug("TIMING:Start TYPE:Action DESC:single_loop call capture RESULT:None")
-    base64_image = capture_image()
+    capture_start_time = time.time()
+    base64_images = capture_image()
+    if recorder:
+        recorder.stage("capture", capture_start_time)
     logger.debug("TIMING:End TYPE:Action DESC:single_loop call capture RESULT:Capture image completed")
 
+    # In continuous mode there is nothing new to say if the scene hasn't changed
+    if config.get('VISMODE') == 'Continuous' and base64_images and scene_change < CHANGE_THRESHOLD:
+        logger.info(f"Scene unchanged ({scene_change:.3f}), skipping narration")
+        record("unchanged", change=scene_change)
+        return
+
     # logger.info(" Sending image for narration ...")
     logger.debug("TIMING:Start TYPE:Action DESC:single_loop call analyze_image RESULT:None")
     analysis_start_time = time.time()
-    analysis = analyze_image(base64_image, script=script)
+    style = getattr(context, "name", None)
+    # Only a press asks about the same spot again, continuous mode wants to hear what changed
+    cacheable = scenes is not None and scene_hash is not None and style in SCENE_CACHE_STYLES
+    analysis = scenes.get(scene_hash, style) if cacheable and config.get('VISMODE') == 'Single' else None
+    if analysis is not None:
+        logger.info("Same scene as before, reusing its narration")
+        record("cache_hit", style=style)
+    else:
+        analysis = analyze_image(base64_images, script=script)
+        if cacheable:
+            scenes.put(scene_hash, style, analysis)
     timings['analysis'] += time.time() - analysis_start_time
+    if recorder:
+        recorder.stage("analyze", analysis_start_time)
     logger.debug(f"TIMING:Start TYPE:Action DESC:single_loop call analyze_image RESULT:{analysis}")
-    del base64_image
+    del base64_images
     logger.info("🎙️ VisGuide says:")
     logger.info(analysis)
 
@@ -694,32 +793,51 @@ def single_loop():
     #play_audio_in_thread(analysis)
     # logging.debug(f"single_loop - calling play_audio")
     logger.debug("TIMING:Start TYPE:Action DESC:single_loop call play_audio RESULT:None")
-    play_audio(analysis)
+    play_audio(analysis, budget=budget)
     timings['audio_playback'] += time.time() - playback_start_time
+    if recorder:
+        recorder.stage("play_audio", playback_start_time)
+        recorder.stage("loop", start_time, first_audio=timings['first_audio'])
     logger.debug("TIMING:Start TYPE:Action DESC:single_loop call play_audio RESULT:Audio playback completed")
 
     script = script + [{"role": "assistant", "content": analysis}]
+    report_timings()
     logger.debug("TIMING:End TYPE:Func DESC:single_loop RESULT:Single loop executed")
 
 
+# FUNC: Report timings
+def report_timings():
+    for operation, time_taken in timings.items():
+        if operation == 'deadline_misses':
+            logger.info(f"{operation}: {time_taken}")
+        else:
+            logger.info(f"{operation}: {time_taken:.2f} seconds")
+
+
 # Main loop
 def main():
     global Action, script, timings, interrupt_main_process
     script = []
-    timings = {'image_encoding': 0, 'analysis': 0, 'audio_playback': 0}
+    timings = {'image_encoding': 0, 'analysis': 0, 'audio_playback': 0, 'first_audio': 0, 'deadline_misses': 0}
     # Set up keyboard event listener only if running on a non-Raspberry Pi device
     if not is_running_on_raspberry_pi():
         logger.debug("Running on a non-Raspberry Pi device, setting up keyboard event listener")
         listener_thread = threading.Thread(target=listen_for_key, daemon=True) # This makes the thread exit when the main program exits
         listener_thread.start()
 
+    # Start the on-device obstacle detector alongside the cloud narration
+    if args.hazard:
+        logger.debug("Starting the hazard monitor")
+        hazard_monitor = obstacle.HazardMonitor(read_hazard_frame, play_hazard_cue)
+        hazard_monitor.start()
+
     while True:
         # Check if the main process needs to be interrupted
         if interrupt_main_process:
             # Reset necessary variables or perform any cleanup
             Action = "None"
             script = []
-            timings = {'image_encoding': 0, 'analysis': 0, 'audio_playback': 0}
+            timings = {'image_encoding': 0, 'analysis': 0, 'audio_playback': 0, 'first_audio': 0, 'deadline_misses': 0}
 
             # Reset the interrupt flag
             interrupt_main_process = False
@@ -728,23 +846,39 @@ def main():
             logger.info("Restarting main process...")
             time.sleep(1)
 
+        # Consecutive failed narrations, continuous mode waits longer after each one
+        failures = 0
         while True:
             try:
-                # If environment variable = single, run single loop
+                # If VISMODE = single, run single loop
                 # logger.debug(f"Main Loop: Action = {Action}")
-                # logger.debug(f"Main Loop: VISMODE = {os.environ.get('VISMODE')}")
-                if os.environ.get('VISMODE') == 'Single':
+                # logger.debug(f"Main Loop: VISMODE = {config.get('VISMODE')}")
+                if config.get('VISMODE') == 'Single':
                     # Wait for the button press
                     if Action == "Single":
                         single_loop()
                         Action = "None"
-                # If environment variable = continuous, run continuous loop
-                elif os.environ.get('VISMODE') == 'Continuous':
+                    else:
+                        config.wait()
+                # If VISMODE = continuous, run continuous loop
+                elif config.get('VISMODE') == 'Continuous':
                     single_loop()
-                    time.sleep(5)
-                time.sleep(1)
+                    failures = 0
+                    # A press or mode change cuts the pause short
+                    config.wait(5)
+                else:
+                    config.wait()
+            except deadline.Cancelled:
+                logger.info("Narration cancelled by a new press")
+                continue
             except Exception as e:
                 logger.error(f"An error occurred in main loop: {e}")
+                # Don't run a failed press again, unless a new press came in meanwhile
+                if not cancel_event.is_set():
+                    Action = "None"
+                if config.get('VISMODE') == 'Continuous':
+                    failures += 1
+                    config.wait(min(60, 5 * 2 ** failures))
                 continue
             except KeyboardInterrupt:
                 logger.info("Script interrupted by user, exiting gracefully.")
@@ -753,29 +887,36 @@ def main():
                     GPIO.cleanup()
                 cap.release()
                 cv2.destroyAllWindows()
+                config.close()
+                if archive:
+                    archive.close()
+                if recorder:
+                    recorder.close()
+                preprocessor.close()
+                if audio_player:
+                    audio_player.close()
                 exit(0)
 
         # Report timings
-        for operation, time_taken in timings.items():
-            logger.info(f"{operation}: {time_taken:.2f} seconds")
+        report_timings()
 
 # Reload the camera driver
 # logger.debug("TIMING:Start TYPE:Action DESC:Reload camera driver RESULT:None")
 # reload_camera_driver("bcm2835-v4l2")
 # logger.debug("TIMING:End TYPE:Action DESC:Reload camera driver RESULT:Camera driver reloaded")
     
-# Check for internet connectivity by pinging Google DNS
-while not check_internet(timeout=60, max_response_time=100):
-    logger.info("Waiting for internet connection...")
-    time.sleep(1)
-
-# Visguide is ready
-# Play audio file ./assets/visguide_is_ready.wav to indicate that VisGuide app is ready
-# load the wav audio file
-wave_obj = sa.WaveObject.from_wave_file("./assets/wav/VisGuide_is_ready.wav")
-# play the audio file
-play_obj = wave_obj.play()
-print("VisGuide is ready")
-
 if __name__ == "__main__":
+    # Check for internet connectivity by pinging Google DNS
+    while not check_internet(timeout=60, max_response_time=100):
+        logger.info("Waiting for internet connection...")
+        time.sleep(1)
+
+    # Visguide is ready
+    # Play audio file ./assets/visguide_is_ready.wav to indicate that VisGuide app is ready
+    # load the wav audio file
+    wave_obj = sa.WaveObject.from_wave_file("./assets/wav/VisGuide_is_ready.wav")
+    # play the audio file
+    play_obj = wave_obj.play()
+    print("VisGuide is ready")
+
     main()
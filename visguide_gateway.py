@@ -0,0 +1,311 @@
+import os
+import json
+import math
+import asyncio
+import hashlib
+import logging
+import argparse
+from http import HTTPStatus
+import httpx
+import preprocess
+import prompt_registry
+from rate_limit import RateLimiter
+from scene_cache import SceneCache, DEFAULT_DISTANCE
+from vision_backends import generate_new_line
+
+### This is visguide_gateway.py ###
+# Local VisGuide API gateway for a shop of several devices. It speaks the same contract as the VisGuide
+# API (POST {"context", "parameters", "script", "image"} -> {"text": ...}) so devices just point
+# VISGUIDE_API_URL at it, and it forwards to the OpenAI chat completions API with:
+#   - one shared pool of keep-alive connections to the upstream provider
+#   - a response cache keyed on a perceptual hash of the image plus the prompt and script (scene_cache.py), so
+#     the same scene seen by another device (or the same one a second later) is answered straight away.
+#     Like visguide.py only Tourist narrations are reused for a similar scene: Guide (and any unknown) prompts
+#     describe hazards, so they are only reused for the very same image and for a few seconds
+#   - request coalescing: identical requests already on their way upstream share the one answer
+#   - a token bucket per device, only spent on requests that actually go upstream
+# It runs on its own (python visguide_gateway.py) or under any ASGI server:
+#   uvicorn --factory visguide_gateway:create_app
+# For trying it out without an OpenAI key, --mock-upstream answers from bench_latency.FakeProviderServer,
+# bench_gateway.py starts it that way and checks the cache, coalescing and rate limits.
+
+logger = logging.getLogger()
+
+# Chat completions parameters a device may set, the VisGuide API also accepts some that chat doesn't (best_of)
+CHAT_PARAMETERS = ("max_tokens", "temperature", "top_p", "frequency_penalty", "presence_penalty")
+MAX_BODY = 4 * 1024 * 1024
+# Prompts (by name in prompts.txt) whose narrations may be reused for a similar looking scene
+REUSE_STYLES = ("Tourist",)
+
+
+class GatewayError(Exception):
+    """A request the gateway can't answer, carries the HTTP status to reply with."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class Gateway:
+    """The gateway application: an ASGI app, or served directly with serve()."""
+
+    def __init__(self, upstream_url, api_key, model="gpt-4-vision-preview", rate=0.5, burst=3,
+                 cache_ttl=60.0, cache_size=256, cache_distance=DEFAULT_DISTANCE, timeout=30.0, max_connections=16,
+                 reuse_prompts=(), exact_ttl=5.0):
+        self.upstream_url = upstream_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.limiter = RateLimiter(rate, burst)
+        self.cache = SceneCache(cache_ttl, cache_size, cache_distance)
+        # Everything else only matches the same image bytes, keyed on a digest of them
+        self.exact_cache = SceneCache(exact_ttl, cache_size, 0)
+        self.reuse_prompts = {prompt_registry.compact(prompt) for prompt in reuse_prompts}
+        self.in_flight = {}
+        self.client = None
+        self.stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "upstream": 0, "rate_limited": 0, "errors": 0}
+
+    # The shared upstream connection pool, made on first use so it belongs to the running event loop
+    def upstream(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.upstream_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    # Devices identify themselves with X-Device-Id, otherwise by address. Never by API key, devices often share
+    # one (or a placeholder) and would all end up in one bucket
+    @staticmethod
+    def device_id(headers, client=None):
+        return headers.get("x-device-id") or client or "unknown"
+
+    # The script (conversation so far) is part of the key: the model is asked not to repeat itself, so the same
+    # scene gets a different answer after a different conversation
+    @staticmethod
+    def prompt_key(request):
+        prompt = json.dumps([str(request.get("context") or ""), request.get("parameters") or {}, request.get("script") or []],
+                            sort_keys=True)
+        return hashlib.sha1(prompt.encode()).hexdigest()
+
+    # Returns the cache for this request and its key in it
+    async def scene_key(self, request):
+        image = request.get("image")
+        if not isinstance(image, str) or not image:
+            raise GatewayError(400, "Request has no image")
+        try:
+            frame = await asyncio.get_running_loop().run_in_executor(None, preprocess.decode_jpeg, image)
+        except ValueError:
+            frame = None
+        if frame is None:
+            raise GatewayError(400, "Image is not a base64 JPEG")
+        if prompt_registry.compact(str(request.get("context") or "")) in self.reuse_prompts:
+            return self.cache, (preprocess.dhash(frame), self.prompt_key(request))
+        digest = int.from_bytes(hashlib.sha1(image.encode()).digest()[:8], "big")
+        return self.exact_cache, (digest, self.prompt_key(request))
+
+    async def ask_upstream(self, request):
+        parameters = {name: value for name, value in (request.get("parameters") or {}).items() if name in CHAT_PARAMETERS}
+        messages = ([{"role": "system", "content": str(request.get("context") or "")}]
+                    + list(request.get("script") or [])
+                    + generate_new_line(request["image"]))
+        try:
+            response = await self.upstream().post("/chat/completions", json={"model": self.model, "messages": messages, **parameters})
+        except httpx.TimeoutException:
+            raise GatewayError(504, "Upstream timed out")
+        except httpx.HTTPError as e:
+            raise GatewayError(502, f"Upstream unreachable: {e}")
+        if response.status_code >= 400:
+            raise GatewayError(502, f"Upstream answered {response.status_code}")
+        return response.json()["choices"][0]["message"]["content"]
+
+    def _finished(self, cache, key, task):
+        self.in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            cache.put(*key, task.result())
+
+    # Answer one analyze_image request from a device
+    async def analyze(self, device, request):
+        self.stats["requests"] += 1
+        cache, key = await self.scene_key(request)
+        # Near enough the same scene counts for reusable prompts, in flight requests only match exactly
+        text = cache.get(*key)
+        if text is not None:
+            self.stats["cache_hits"] += 1
+            return text
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            wait = self.limiter.take(device)
+            if wait:
+                self.stats["rate_limited"] += 1
+                raise GatewayError(429, f"Device {device} is over its rate limit", {"Retry-After": str(math.ceil(wait))})
+            self.stats["upstream"] += 1
+            task = asyncio.ensure_future(self.ask_upstream(request))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(cache, key, done))
+        # Shielded so one device hanging up doesn't cancel the answer for the others waiting on it
+        return await asyncio.shield(task)
+
+    # Route one HTTP request, returns (status, extra headers, JSON payload)
+    async def handle(self, method, path, headers, body, client=None):
+        path = path.split("?", 1)[0]
+        if method == "GET" and path == "/health":
+            return 200, {}, {"status": "ok"}
+        if method == "GET" and path == "/stats":
+            return 200, {}, dict(self.stats, in_flight=len(self.in_flight), cached=len(self.cache) + len(self.exact_cache))
+        if method != "POST" or path not in ("/", "/analyze"):
+            return 404, {}, {"error": "Not found"}
+        try:
+            request = json.loads(body)
+            if not isinstance(request, dict):
+                raise ValueError
+        except ValueError:
+            return 400, {}, {"error": "Body is not a JSON object"}
+        device = self.device_id(headers, client)
+        try:
+            text = await self.analyze(device, request)
+        except GatewayError as e:
+            if e.status >= 500:
+                self.stats["errors"] += 1
+            logger.warning(f"Gateway request from {device} failed: {e}")
+            return e.status, e.headers, {"error": str(e)}
+        return 200, {}, {"text": text}
+
+    # ASGI entry point
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await self.close()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        client = scope.get("client")
+        status, extra_headers, payload = await self.handle(scope["method"], scope["path"], headers, body, client[0] if client else None)
+        data = json.dumps(payload).encode()
+        response_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())]
+        response_headers += [(name.lower().encode(), value.encode()) for name, value in extra_headers.items()]
+        await send({"type": "http.response.start", "status": status, "headers": response_headers})
+        await send({"type": "http.response.body", "body": data})
+
+    # Minimal HTTP/1.1 server with keep-alive, so the gateway runs without an ASGI server installed
+    async def _connection(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY:
+                    status, extra_headers, payload = 413, {}, {"error": "Request too large"}
+                    headers["connection"] = "close"
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, extra_headers, payload = await self.handle(method, path, headers, body, peer[0] if peer else None)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                data = json.dumps(payload).encode()
+                head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+                        "Content-Type: application/json",
+                        f"Content-Length: {len(data)}",
+                        "Connection: keep-alive" if keep_alive else "Connection: close"]
+                head += [f"{name}: {value}" for name, value in extra_headers.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="0.0.0.0", port=8080):
+        server = await asyncio.start_server(self._connection, host, port)
+        logger.info(f"VisGuide gateway listening on {host}:{port}, upstream {self.upstream_url}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.close()
+
+
+# FUNC: The prompts whose narrations may be reused for a similar scene, none if prompts.txt can't be read
+def reusable_prompts(path, names=REUSE_STYLES):
+    try:
+        prompts = prompt_registry.load_prompts(path)
+    except (OSError, prompt_registry.PromptError) as e:
+        logger.warning(f"Could not load {path}, no narrations will be reused for similar scenes: {e}")
+        return []
+    return [prompts[name] for name in names if name in prompts]
+
+
+# FUNC: Gateway configured from the environment (used as the ASGI app factory)
+def create_app():
+    return Gateway(
+        upstream_url=os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+        api_key=os.environ.get("OPENAI_API_KEY", ""),
+        model=os.environ.get("VISGUIDE_GATEWAY_MODEL", "gpt-4-vision-preview"),
+        rate=float(os.environ.get("VISGUIDE_GATEWAY_RATE", 0.5)),
+        burst=int(os.environ.get("VISGUIDE_GATEWAY_BURST", 3)),
+        cache_ttl=float(os.environ.get("VISGUIDE_GATEWAY_CACHE_TTL", 60)),
+        cache_size=int(os.environ.get("VISGUIDE_GATEWAY_CACHE_SIZE", 256)),
+        cache_distance=int(os.environ.get("VISGUIDE_GATEWAY_CACHE_DISTANCE", DEFAULT_DISTANCE)),
+        reuse_prompts=reusable_prompts(os.environ.get("VISGUIDE_GATEWAY_PROMPTS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts.txt"))),
+        exact_ttl=float(os.environ.get("VISGUIDE_GATEWAY_EXACT_TTL", 5)),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local VisGuide API gateway")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("-p", "--port", type=int, default=8080)
+    parser.add_argument("--mock-upstream", action="store_true", help="Answer from a local fake OpenAI instead of the real one")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Seconds before the mock upstream answers")
+    parser.add_argument("-d", "--debug", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    mock = None
+    if args.mock_upstream:
+        from bench_latency import FakeProviderServer
+        mock = FakeProviderServer(llm_latency=args.llm_latency).start()
+        os.environ["OPENAI_BASE_URL"] = mock.url
+        # The mock doesn't check the key, but an empty one makes an invalid Authorization header
+        os.environ.setdefault("OPENAI_API_KEY", "mock")
+    try:
+        asyncio.run(create_app().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if mock:
+            mock.stop()
@@ -0,0 +1,245 @@
+import os
+import abc
+import time
+import uuid
+import socket
+import logging
+from threading import Lock
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from deadline import Cancelled
+
+### This is vision_backends.py ###
+# The vision models VisGuide can narrate with, behind one interface, plus a router that picks the
+# fastest healthy one and hedges slow requests by firing a second backend after a deadline.
+
+logger = logging.getLogger()
+
+# Default request parameters sent to the VisGuide API
+VISGUIDE_API_PARAMETERS = {
+    "max_tokens": 64,
+    "temperature": 0.8,
+    "top_p": 1,
+    "frequency_penalty": 0.0,
+    "presence_penalty": 0.0,
+    "best_of": 1,
+}
+
+
+# FUNC: This device's id for the VisGuide API (and gateway rate limits), VISGUIDE_DEVICE_ID or the host name
+# plus the network card's address, so every Pi called raspberrypi still gets its own
+def device_id():
+    return os.environ.get("VISGUIDE_DEVICE_ID") or f"{socket.gethostname()}-{uuid.getnode():012x}"
+
+
+# FUNC: Headers for a VisGuide API request, there's no Authorization header without a key
+def visguide_api_headers(api_key, device=None):
+    headers = {"X-Device-Id": device or device_id()}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    return headers
+
+
+# FUNC: Generates the OpenAI "user" script
+def generate_new_line(base64_images):
+    logger.debug("TIMING:Start TYPE:Func DESC:generate_new_line RESULT:None")
+    if isinstance(base64_images, str):
+        base64_images = [base64_images]
+    text = "Describe this image"
+    if len(base64_images) > 1:
+        text = "Describe this image. The first image is the path ahead, the second is a low resolution view of the whole scene"
+    return [
+        {
+            "role": "user",
+            "content": [{"type": "text", "text": text}]
+            + [
+                {
+                    "type": "image_url",
+                    "image_url": f"data:image/jpeg;base64,{base64_image}",
+                }
+                for base64_image in base64_images
+            ],
+        },
+    ]
+
+
+class VisionBackend(abc.ABC):
+    """A vision model that turns a prompt, the conversation so far and the captured image(s) into a narration."""
+    name = "base"
+
+    @abc.abstractmethod
+    def describe(self, context, script, base64_images, timeout=None):
+        pass
+
+
+class OpenAIVisionBackend(VisionBackend):
+    """Calls the OpenAI chat completions API directly."""
+
+    def __init__(self, client, model="gpt-4-vision-preview", max_tokens=500):
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.name = f"openai:{model}"
+
+    def describe(self, context, script, base64_images, timeout=None):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "system", "content": context}]
+            + script
+            + generate_new_line(base64_images),
+            max_tokens=self.max_tokens,
+            timeout=timeout,
+        )
+        return response.choices[0].message.content
+
+
+class VisGuideAPIBackend(VisionBackend):
+    """Posts the image and prompt to the VisGuide API (see visguide-api.py) and reuses one HTTP session."""
+
+    def __init__(self, api_url, api_key, parameters=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.parameters = parameters or VISGUIDE_API_PARAMETERS
+        self.session = requests.Session()
+        self.session.headers.update(visguide_api_headers(api_key))
+        self.name = "visguide-api"
+
+    def describe(self, context, script, base64_images, timeout=None):
+        if isinstance(base64_images, str):
+            base64_images = [base64_images]
+        response = self.session.post(
+            self.api_url,
+            json={
+                "context": str(context),
+                "parameters": self.parameters,
+                "script": script,
+                "image": base64_images[0],
+            },
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        narrative = response.json()
+        return narrative["text"] if isinstance(narrative, dict) else narrative
+
+
+class BackendStats:
+    """Rolling latency and error window for one backend."""
+
+    def __init__(self, window=20):
+        self.latencies = deque(maxlen=window)
+        self.errors = deque(maxlen=window)
+        self.lock = Lock()
+
+    def record(self, latency, ok):
+        with self.lock:
+            if ok:
+                self.latencies.append(latency)
+            self.errors.append(not ok)
+
+    def p50(self):
+        with self.lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+            return ordered[len(ordered) // 2]
+
+    def error_rate(self):
+        with self.lock:
+            return sum(self.errors) / len(self.errors) if self.errors else 0.0
+
+    # Lower is better. Untried backends score 0 so they all get a first chance
+    def score(self, error_penalty=4.0):
+        with self.lock:
+            calls = len(self.errors)
+        if not calls:
+            return 0.0
+        p50 = self.p50()
+        if p50 is None:
+            return float("inf")
+        return p50 * (1.0 + error_penalty * self.error_rate())
+
+
+class BackendRouter:
+    """Sends each request to the backend with the best recent p50 latency and error rate.
+
+    If the chosen backend hasn't answered within hedge_after seconds (or fails), the next best one is
+    fired as well and whichever answers first wins.
+
+    The losing, timed out or cancelled requests are abandoned, not stopped: they keep running in the
+    router's executor until the backend answers or its own timeout passes, and their result is dropped.
+    The executor has two workers per backend, so at most that many requests are ever in flight and a
+    new request queues behind abandoned ones if the backends are that slow.
+    """
+
+    def __init__(self, backends, hedge_after=None, window=20):
+        if not backends:
+            raise ValueError("At least one vision backend is needed")
+        self.backends = list(backends)
+        self.hedge_after = hedge_after
+        self.stats = {backend.name: BackendStats(window) for backend in self.backends}
+        self.executor = ThreadPoolExecutor(max_workers=2 * len(self.backends), thread_name_prefix="vision")
+
+    def ranked(self):
+        return sorted(self.backends, key=lambda backend: self.stats[backend.name].score())
+
+    def _call(self, backend, context, script, base64_images, timeout):
+        start = time.time()
+        try:
+            result = backend.describe(context, script, base64_images, timeout=timeout)
+        except Exception:
+            self.stats[backend.name].record(time.time() - start, False)
+            raise
+        self.stats[backend.name].record(time.time() - start, True)
+        logger.debug(f"Vision backend {backend.name} answered in {time.time() - start:.2f} seconds")
+        return result
+
+    def describe(self, context, script, base64_images, timeout=None, cancel_event=None):
+        waiting = deque(self.ranked())
+        pending = {}
+        last_error = None
+
+        def fire():
+            backend = waiting.popleft()
+            logger.debug(f"Routing vision request to {backend.name}")
+            future = self.executor.submit(self._call, backend, context, script, base64_images, timeout)
+            pending[future] = backend
+            return time.time() + self.hedge_after if self.hedge_after is not None else None
+
+        hedge_at = fire()
+        expires = time.time() + timeout if timeout else None
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                raise Cancelled("vision request cancelled")
+            now = time.time()
+            if expires is not None and now >= expires:
+                break
+            if waiting and hedge_at is not None and now >= hedge_at:
+                # Hedge: the current backend(s) are slow, fire the next best one too
+                logger.info(f"Vision request slow, hedging with {waiting[0].name}")
+                hedge_at = fire()
+                continue
+            wake_times = [t for t in (expires, hedge_at if waiting else None) if t is not None]
+            wait_for = max(0, min(wake_times) - now) if wake_times else None
+            # Wake up regularly to notice a cancel
+            if cancel_event is not None:
+                wait_for = 0.1 if wait_for is None else min(wait_for, 0.1)
+            done, _ = wait(list(pending), timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    logger.warning(f"Vision backend {backend.name} failed: {e}")
+                    last_error = e
+            # Fail over straight away if nothing else is in flight
+            if not pending and waiting:
+                hedge_at = fire()
+        if last_error is not None and not pending:
+            raise last_error
+        raise TimeoutError("No vision backend answered in time")
+
+    def report(self):
+        return ", ".join(
+            f"{name}: p50={stats.p50() or 0:.2f}s errors={stats.error_rate():.0%}" for name, stats in self.stats.items()
+        )